@@ -0,0 +1,152 @@
+import asyncio
+import io
+import sys
+from flask import request_started
+from werkzeug.exceptions import HTTPException
+from main import create_app
+from async_db import async_db
+from controllers.async_controller import async_routes
+
+
+# ASGI entry point, the read routes of async_routes run on the event loop with an AsyncSession,
+# so many concurrent reads share one process, every other route is the flask app run in a thread
+# e.g. uvicorn --factory asgi:create_asgi_app --port 8080
+def create_asgi_app():
+    app = create_app()
+    async_db.init_app(app)
+    return AsgiApp(app, async_routes)
+
+
+# WSGI environ of an ASGI http request, so flask can build its request object from it
+def _environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin-1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+class AsgiApp:
+    def __init__(self, app, routes):
+        self.app = app
+        self.url_map = routes.url_map()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] == "websocket":
+            # no route accepts websockets, the handshake is refused
+            await receive()
+            await send({"type": "websocket.close", "code": 1000})
+            return
+        if scope["type"] != "http":
+            raise NotImplementedError(f"Unsupported ASGI scope '{scope['type']}'")
+
+        environ = _environ(scope, await _read_body(receive))
+        try:
+            view, kwargs = self.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            # not found, wrong method or a trailing slash redirect, the flask app answers those
+            view = None
+
+        if view is None:
+            status, headers, body = await asyncio.to_thread(self._call_flask, environ)
+            await self._send(send, scope, status, headers, body)
+            return
+
+        with self.app.request_context(environ):
+            async with async_db.session_scope():
+                response = await self._dispatch(view, kwargs)
+                # streamed bodies read from the session, so it stays open until they are sent
+                await self._send(send, scope, response.status_code, response.headers.to_wsgi_list(),
+                                 response.response if hasattr(response.response, "__aiter__")
+                                 else response.iter_encoded())
+
+    # the same steps as flask's full_dispatch_request, so before_request / after_request handlers
+    # (e.g. the profiler) run for the async routes too
+    async def _dispatch(self, view, kwargs):
+        from_error_handler = False
+        try:
+            request_started.send(self.app)
+            rv = self.app.preprocess_request()
+            if rv is None:
+                rv = await view(**kwargs)
+        except Exception as err:
+            # abort(), validation errors and the rest go through the flask error handlers
+            try:
+                rv = self.app.handle_user_exception(err)
+            except Exception as unhandled:
+                rv = self.app.handle_exception(unhandled)
+                from_error_handler = True
+        return self.app.finalize_request(rv, from_error_handler=from_error_handler)
+
+    # run the flask app in a worker thread, its response is read there too,
+    # so the request context of stream_with_context stays valid while streaming
+    def _call_flask(self, environ):
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = headers
+
+        result = self.app(environ, start_response)
+        try:
+            body = list(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return started["status"], started["headers"], body
+
+    async def _send(self, send, scope, status, headers, body):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        })
+        if scope["method"] != "HEAD":
+            if hasattr(body, "__aiter__"):
+                async for chunk in body:
+                    await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+            else:
+                for chunk in body:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await async_db.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
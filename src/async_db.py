@@ -0,0 +1,69 @@
+import contextlib
+import contextvars
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from db_pool import instrument_engine
+from profiling import request_profiler
+
+
+# async driver used for each database backend of DATABASE_URL
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+# DATABASE_URL with its driver replaced by the async one, e.g. postgresql+psycopg2:// -> postgresql+asyncpg://
+def async_database_uri(database_uri):
+    url = make_url(database_uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for '{backend}' databases, set ASYNC_DATABASE_URL")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+# async engine and one AsyncSession per request for the async read routes,
+# it maps the same models as db, so the schemas and loader options are shared
+class AsyncDatabase:
+    def __init__(self):
+        self.engine = None
+        self._sessionmaker = None
+        self._session = contextvars.ContextVar("async_session", default=None)
+
+    def init_app(self, app):
+        uri = app.config.get("ASYNC_DATABASE_URI") or async_database_uri(app.config["SQLALCHEMY_DATABASE_URI"])
+        options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+        # the async engine needs its own async adapted pool, the sync pool class does not apply
+        options.pop("poolclass", None)
+        self.engine = create_async_engine(uri, **options)
+        instrument_engine(self.engine.sync_engine, "async")
+        request_profiler.instrument_engine(self.engine.sync_engine)
+        # rows are dumped after the session is closed, keep their loaded attributes
+        self._sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    # the async engine by bind key, for the pool metrics
+    @property
+    def engines(self):
+        return {"async": self.engine.sync_engine} if self.engine is not None else {}
+
+    # the session of the current request
+    @property
+    def session(self):
+        session = self._session.get()
+        if session is None:
+            raise RuntimeError("No async session, the route must run inside async_db.session_scope()")
+        return session
+
+    # one session for a request, closed (and its connection returned to the pool) at the end
+    @contextlib.asynccontextmanager
+    async def session_scope(self):
+        async with self._sessionmaker() as session:
+            token = self._session.set(session)
+            try:
+                yield session
+            finally:
+                self._session.reset(token)
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+
+
+async_db = AsyncDatabase()
@@ -1,5 +1,6 @@
 import functools
-from flask_jwt_extended import get_jwt_identity
+from flask import g
+from flask_jwt_extended import get_jwt_identity, get_jwt
 from init import db
 from models.garden import Garden
 from models.user import User
@@ -8,13 +9,34 @@ from models.garden_plant import GardenPlant
 from models.plant import Plant
 
 
+# request scoped cache of loaded rows, stored on flask.g
+# the decorators and the views share it, so each entity is only selected once per request
+def get_cached(model, *options, **filters):
+    loaded = g.setdefault("loaded_entities", {})
+    key = (model, tuple(sorted(filters.items())))
+    # loader options ask for relationships the cached row may not have loaded, so select again
+    if options or key not in loaded:
+        stmt = db.select(model).options(*options).filter_by(**filters)
+        loaded[key] = db.session.scalar(stmt)
+    return loaded[key]
+
+
+# get current login user from jwt token
+def get_current_user():
+    return get_user(int(get_jwt_identity()))
+
+
 # check current user is admin or not
+# tokens carry a verified is_admin claim, so no database query is needed,
+# tokens issued before the claim existed fall back to the users table
 def is_current_user_admin():
-    user_id = get_jwt_identity()
-    stmt = db.select(User).filter_by(id=user_id)
-    user = db.session.scalar(stmt)
+    claims = get_jwt()
+    if "is_admin" in claims:
+        return claims["is_admin"]
+
+    user = get_current_user()
     if not user:
-        return {"error": "User not found"}, 404
+        return False
     return user.is_admin
 
 
@@ -22,10 +44,7 @@ def is_current_user_admin():
 def authorise_as_admin(fn):
     @functools.wraps(fn)
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        stmt = db.select(User).filter_by(id=user_id)
-        user = db.session.scalar(stmt)
-        if user.is_admin:
+        if is_current_user_admin():
             return fn(*args, **kwargs)
         else:
             return {"error": "Not authorised to perform action"}, 403
@@ -40,9 +59,8 @@ def authorise_as_admin_or_garden_owner(fn):
         # Get user id from jwt token (current login user)
         user_id = get_jwt_identity()
 
-        # Database query to get the garden
-        stmt = db.select(Garden).filter_by(id=kwargs["garden_id"])
-        garden = db.session.scalar(stmt)
+        # Database query to get the garden, cached for the view
+        garden = get_garden(kwargs["garden_id"])
         if garden:
             # Check if the user is an admin or the owner of the garden
             if str(garden.user_id) == user_id or is_current_user_admin():
@@ -64,18 +82,14 @@ def authorise_as_account_owner_or_admin(fn):
 
         # Database query to get the user parameter
         # if parameter user id not found in database, return error message
-        stmt = db.select(User).filter_by(id=kwargs["user_id"])
-        user = db.session.scalar(stmt)
+        user = get_user(kwargs["user_id"])
 
         if not user:
             return {"error": f"User id: '{kwargs['user_id']}' not found"}, 404
 
         # check if login user is admin or user id in database is the same as the user id passed in parameter
         # if yes, return the function, otherwise return error message
-        stmt = db.select(User).filter_by(id=user_id)
-        login_user = db.session.scalar(stmt)
-
-        if login_user.is_admin or login_user.id == kwargs["user_id"]:
+        if user_id == str(kwargs["user_id"]) or is_current_user_admin():
             return fn(*args, **kwargs)
         else:
             return {"error": "Not authorised to perform action"}, 403
@@ -84,30 +98,26 @@ def authorise_as_account_owner_or_admin(fn):
 
 
 # query functions, check if the id passed in parameter exists in database
-def get_user(user_id):
-    stmt = db.select(User).filter_by(id=user_id)
-    return db.session.scalar(stmt)
+# optional loader options can be passed to eager load the relationships the response will dump
+# results are cached for the rest of the request
+def get_user(user_id, *options):
+    return get_cached(User, *options, id=user_id)
 
 
 def get_comment(comment_id, garden_id):
-    stmt = db.select(Comment).filter_by(id=comment_id, garden_id=garden_id)
-    return db.session.scalar(stmt)
+    return get_cached(Comment, id=comment_id, garden_id=garden_id)
 
 
-def get_garden(garden_id):
-    stmt = db.select(Garden).filter_by(id=garden_id)
-    return db.session.scalar(stmt)
+def get_garden(garden_id, *options):
+    return get_cached(Garden, *options, id=garden_id)
 
 
-def get_plant(plant_id):
-    stmt = db.select(Plant).filter_by(id=plant_id)
-    return db.session.scalar(stmt)
+def get_plant(plant_id, *options):
+    return get_cached(Plant, *options, id=plant_id)
 
 
 def get_garden_plant(garden_plant_id, garden_id):
-    stmt = db.select(GardenPlant).filter_by(
-        garden_id=garden_id, id=garden_plant_id)
-    return db.session.scalar(stmt)
+    return get_cached(GardenPlant, garden_id=garden_id, id=garden_plant_id)
 
 
 def is_admin_or_comment_owner(comment, user_id):
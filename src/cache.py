@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# in-process LRU cache with expiry, used when no redis server is configured
+# it has the same get / set(ex=) / delete interface as a redis client, so the two are interchangeable
+class LRUCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[name]
+                return None
+            self._data.move_to_end(name)
+            return value
+
+    def set(self, name, value, ex=None):
+        expires_at = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._data[name] = (value, expires_at)
+            self._data.move_to_end(name)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+
+# cache extension, picks the backend from the app config:
+# CACHE_CLIENT - any redis compatible client object (e.g. a fake redis for local runs)
+# CACHE_REDIS_URL - connect to a redis server, needs the redis package
+# otherwise an LRUCache of CACHE_MAX_ENTRIES entries
+class Cache:
+    def __init__(self):
+        self.client = None
+        self.default_ttl = 300
+
+    def init_app(self, app):
+        self.default_ttl = app.config.get("CACHE_TTL", 300)
+        if app.config.get("CACHE_CLIENT") is not None:
+            self.client = app.config["CACHE_CLIENT"]
+        elif app.config.get("CACHE_REDIS_URL"):
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError(
+                    "CACHE_REDIS_URL is set but the redis package is not installed")
+            self.client = redis.Redis.from_url(
+                app.config["CACHE_REDIS_URL"], decode_responses=True)
+        else:
+            self.client = LRUCache(app.config.get("CACHE_MAX_ENTRIES", 1024))
+
+    def get(self, key):
+        value = self.client.get(key)
+        # redis clients without decode_responses return bytes
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return value
+
+    # ttl=None uses CACHE_TTL, ttl=0 keeps the key until it is deleted or evicted
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.client.set(key, value, ex=ttl or None)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*keys)
@@ -0,0 +1,184 @@
+import atexit
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from init import db
+from models.comment import Comment
+from garden_versions import bump_garden_comment_counts
+
+
+# seconds before the first retry of a batch the database did not take, doubled for each retry
+COMMENT_RETRY_BACKOFF = 0.5
+
+# raised when the ingestion queue is full, answered with 503 so clients back off
+class IngestionBusy(Exception):
+    pass
+
+
+# batched comment ingestion, enabled with COMMENT_INGESTION=batched
+# accepted comments wait on an in-process queue and a background thread writes them
+# with one multi-row insert and one commit per batch, instead of one commit per comment
+class CommentIngestor:
+    def __init__(self):
+        self.app = None
+        self.queue = None
+        self.thread = None
+        self._lock = threading.Lock()
+        self.stats = {"accepted": 0, "rejected": 0, "written": 0, "dropped": 0,
+                      "retries": 0, "requeued": 0, "batches": 0, "last_batch_size": 0, "last_flush_ms": 0.0}
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get("COMMENT_BATCH_SIZE", 200)
+        self.flush_interval = app.config.get("COMMENT_FLUSH_INTERVAL", 0.5)
+        self.write_retries = app.config.get("COMMENT_WRITE_RETRIES", 5)
+        self.queue = queue.Queue(maxsize=app.config.get("COMMENT_QUEUE_LIMIT", 10000))
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config.get("COMMENT_INGESTION") == "batched"
+
+    # queue a validated comment, returns its provisional id
+    def submit(self, message, user_id, garden_id):
+        self._start()
+        provisional_id = uuid.uuid4().hex
+        row = {"message": message, "comment_date": date.today(),
+               "user_id": int(user_id), "garden_id": garden_id}
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self._count(rejected=1)
+            raise IngestionBusy()
+        self._count(accepted=1)
+        return provisional_id
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        return {**stats, "queue_depth": self.queue.qsize() if self.queue else 0,
+                "queue_limit": self.queue.maxsize if self.queue else 0}
+
+    # the writer thread is started on the first comment, so cli commands do not start it
+    def _start(self):
+        with self._lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="comment-ingestion", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    # rows the database could not take after the retries go back on the queue
+    def _run(self):
+        while True:
+            self._requeue(self._write(self._next_batch()))
+
+    def _requeue(self, rows):
+        for index, row in enumerate(rows):
+            try:
+                self.queue.put_nowait(row)
+            except queue.Full:
+                self.app.logger.error("Comment queue is full, dropped %d comments", len(rows) - index)
+                self._count(dropped=len(rows) - index)
+                return
+            self._count(requeued=1)
+
+    # wait for a first comment, then collect more until the batch is full or the interval is over
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    # write everything that is queued right now, e.g. on shutdown
+    def flush(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            lost = self._write(batch)
+            if lost:
+                # nothing writes the queue after shutdown
+                self.app.logger.error("Database unavailable, dropped %d comments on shutdown", len(lost))
+                self._count(dropped=len(lost))
+
+    # write a batch, returns the rows that are still not written after the retries
+    # a row the database rejects (IntegrityError, e.g. a garden deleted while its comments were queued)
+    # is dropped, any other error (e.g. OperationalError on a lost connection) is retried with backoff
+    def _write(self, batch):
+        started = time.perf_counter()
+        rows = list(batch)
+        counts = Counter()
+        for attempt in range(self.write_retries + 1):
+            if attempt:
+                delay = COMMENT_RETRY_BACKOFF * 2 ** (attempt - 1)
+                self.app.logger.warning("Writing %d queued comments failed (%s), retrying in %ss",
+                                        len(rows), getattr(error, "orig", error), delay)
+                counts["retries"] += 1
+                time.sleep(delay)
+            with self.app.app_context():
+                try:
+                    self._insert_rows(rows, counts)
+                    break
+                except SQLAlchemyError as err:
+                    error = err
+                finally:
+                    db.session.remove()
+
+        self._count(**counts)
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["last_batch_size"] = len(batch)
+            self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return rows
+
+    # rows are removed from the list once they are written or dropped,
+    # so a retry after a connection error does not write them twice
+    def _insert_rows(self, rows, counts):
+        try:
+            self._insert(rows)
+            counts["written"] += len(rows)
+            rows.clear()
+            return
+        except IntegrityError:
+            # retry one by one so one bad row does not drop the whole batch
+            db.session.rollback()
+        while rows:
+            try:
+                self._insert(rows[:1])
+                counts["written"] += 1
+            except IntegrityError:
+                db.session.rollback()
+                counts["dropped"] += 1
+                self.app.logger.warning("Dropped queued comment for garden id %s", rows[0]["garden_id"])
+            rows.pop(0)
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                self.stats[name] += count
+
+    def _insert(self, rows):
+        db.session.execute(insert(Comment), rows)
+        bump_garden_comment_counts(Counter(row["garden_id"] for row in rows),
+                                   max(row["comment_date"] for row in rows))
+        db.session.commit()
+
+
+comment_ingestor = CommentIngestor()
@@ -0,0 +1,132 @@
+from flask import request
+from werkzeug.routing import Map, Rule
+from init import db, cache
+from async_db import async_db
+from models.garden import Garden
+from models.garden_plant import GardenPlant
+from models.plant import Plant
+from schemas.garden_schema import garden_schema
+from schemas.garden_plant_schema import garden_plants_schema
+from schemas.plant_schema import plant_schema, plants_update_schema
+from controllers.garden_controller import list_schema
+from query_options import schema_load_options
+from garden_versions import version_etag, etag_header, is_not_modified
+from pagination import paginate_async, page_headers, page_args
+from streaming import stream_requested, stream_dump_async
+from projection import project, projection_key
+from plant_cache import catalogue_key, plant_key, to_json, json_response
+
+
+# async GET routes served by the ASGI app (asgi.py), every other route goes to the flask views
+# the views return the same values as flask views and run inside a flask request context,
+# so request, abort, the error handlers and app.json work as usual
+class AsyncRoutes:
+    def __init__(self):
+        self.views = []
+
+    def get(self, rule):
+        def decorator(view):
+            self.views.append((rule, view))
+            return view
+        return decorator
+
+    def url_map(self):
+        return Map([Rule(rule, endpoint=view, methods=["GET"]) for rule, view in self.views])
+
+
+async_routes = AsyncRoutes()
+
+
+async def _garden_etag(garden_id):
+    version = await async_db.session.scalar(
+        db.select(Garden.version).filter_by(id=garden_id))
+    if version is None:
+        return None
+    return version_etag(garden_id, version)
+
+
+# garden/-get all gardens route
+@async_routes.get("/garden/")
+async def get_all_gardens():
+    schema = project(list_schema())
+    stmt = db.select(Garden).options(
+        *schema_load_options(Garden, schema))
+    if stream_requested():
+        return stream_dump_async(async_db.session, stmt.order_by(Garden.id.desc()), schema)
+    gardens, next_cursor = await paginate_async(async_db.session, stmt, Garden.id, descending=True)
+    return schema.dump(gardens), 200, page_headers(next_cursor)
+
+
+# garden/garden_id-get garden by id route
+@async_routes.get("/garden/<int:id>")
+async def get_garden_by_id(id):
+    etag = await _garden_etag(id)
+    if etag is None:
+        return {"error": f"Garden id:'{id}' not found"}, 404
+    if is_not_modified(etag):
+        return "", 304, etag_header(etag)
+
+    schema = project(garden_schema)
+    garden = await async_db.session.scalar(
+        db.select(Garden).options(*schema_load_options(Garden, schema)).filter_by(id=id))
+    return schema.dump(garden), 200, etag_header(etag)
+
+
+# garden/garden_id/garden_plants -get route
+@async_routes.get("/garden/<int:garden_id>/garden_plants")
+async def get_garden_plants(garden_id):
+    etag = await _garden_etag(garden_id)
+    if etag is None:
+        return {"error": f"Garden id:'{garden_id}' not found"}, 404
+
+    schema = project(garden_plants_schema)
+    stmt = db.select(GardenPlant).options(
+        *schema_load_options(GardenPlant, schema)).filter_by(garden_id=garden_id)
+    if stream_requested():
+        return stream_dump_async(async_db.session, stmt.order_by(GardenPlant.id), schema)
+    if is_not_modified(etag):
+        return "", 304, etag_header(etag)
+    garden_plants, next_cursor = await paginate_async(async_db.session, stmt, GardenPlant.id)
+    if garden_plants or request.args.get("after"):
+        return schema.dump(garden_plants), 200, {**page_headers(next_cursor), **etag_header(etag)}
+    else:
+        return {"error": f"No garden_plants found in garden id: '{garden_id}'"}, 404
+
+
+# plants -get route, shares the catalogue page cache with the flask view
+@async_routes.get("/plant/")
+async def get_all_plants():
+    schema = project(plants_update_schema)
+    stmt = db.select(Plant).options(*schema_load_options(Plant, schema))
+    if stream_requested():
+        return stream_dump_async(async_db.session, stmt.order_by(Plant.id), schema)
+    key = catalogue_key(*page_args(), projection_key())
+    cached = cache.get(key)
+    if cached is not None:
+        next_cursor, body = cached.split("\n", 1)
+        return json_response(body, page_headers(next_cursor))
+
+    plants, next_cursor = await paginate_async(async_db.session, stmt, Plant.id)
+    body = to_json(schema.dump(plants))
+    cache.set(key, f"{next_cursor or ''}\n{body}")
+    return json_response(body, page_headers(next_cursor))
+
+
+# get a plant by id -get route, shares the plant cache with the flask view
+@async_routes.get("/plant/<int:id>")
+async def get_plant_by_id(id):
+    schema = project(plant_schema)
+    if schema is plant_schema:
+        cached = cache.get(plant_key(id))
+        if cached is not None:
+            return json_response(cached)
+
+    plant = await async_db.session.scalar(
+        db.select(Plant).options(*schema_load_options(Plant, schema)).filter_by(id=id))
+    if plant:
+        body = to_json(schema.dump(plant))
+        if schema is plant_schema:
+            cache.set(plant_key(id), body)
+        return json_response(body)
+    else:
+        return {"message": f"Plant id:'{id}' not found"}, 404
@@ -1,5 +1,5 @@
 from flask import Blueprint, request
-from init import db, bcrypt
+from init import db
 from flask_jwt_extended import create_access_token
 from sqlalchemy.exc import IntegrityError
 from psycopg2 import errorcodes
@@ -8,6 +8,17 @@ from models.user import User
 from schemas.user_schema import user_schema, users_schema, get_user_schema, update_user_schema, user_register_schema
 from flask_jwt_extended import jwt_required
 from auth_deco import authorise_as_admin, authorise_as_account_owner_or_admin, is_current_user_admin, get_user
+from query_options import schema_load_options
+from token_versions import bump_token_version, forget_token_version
+from password_hashing import hash_password, check_password, needs_rehash
+from plant_cache import invalidate_plants, plant_ids_in_gardens
+from models.garden import Garden
+from models.comment import Comment
+from garden_versions import bump_garden_versions, gardens_of_user, recounted_comments
+from pagination import paginate, page_headers
+from streaming import stream_requested, stream_dump
+from projection import project
+from row_reads import read_statement
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 
@@ -26,8 +37,7 @@ def auth_register():
         user.user_name = body_data.get("user_name")
         user.email = body_data.get("email")
         if body_data.get("password"):
-            user.password = bcrypt.generate_password_hash(
-                body_data.get("password")).decode("utf-8")
+            user.password = hash_password(body_data.get("password"))
         # add new user to session
         db.session.add(user)
         # commit to add the user to database
@@ -57,10 +67,17 @@ def auth_register():
 @jwt_required()
 @authorise_as_admin
 def auth_user():
-    stmt = db.select(User).order_by(User.id)
-    users_list = db.session.scalars(stmt)
-    result = users_schema.dump(users_list)
-    return result
+    # ?fields= narrows the dump and the loaded columns
+    schema = project(users_schema)
+    # the users are flat, they are read as Core rows (see row_reads.py)
+    stmt, rows = read_statement(User, schema)
+    # ?stream=true streams every user instead of one page
+    if stream_requested():
+        return stream_dump(stmt.order_by(User.id), schema, rows=rows)
+    # paginated with ?limit=&after=
+    users_list, next_cursor = paginate(stmt, User.id, rows=rows)
+    result = schema.dump(users_list)
+    return result, 200, page_headers(next_cursor)
 
 
 # auth/user/user_id - get user by id route
@@ -69,10 +86,12 @@ def auth_user():
 @jwt_required()
 @authorise_as_admin
 def auth_user_by_id(id):
-    user = get_user(id)
+    # ?fields= and ?include= choose the columns and relationships, e.g. ?include= leaves out the gardens
+    schema = project(get_user_schema)
+    user = get_user(id, *schema_load_options(User, schema))
     if not user:
         return {"error": f"User id:'{id}' not found"}, 404
-    result = get_user_schema.dump(user)
+    result = schema.dump(user)
     return result
 
 
@@ -88,9 +107,17 @@ def auth_login():
         User.email == body_data.get("email"))  # get user from database
     user = db.session.scalar(stmt)
     # If user exists and password is correct
-    if user and bcrypt.check_password_hash(user.password, body_data.get("password")):
+    if user and check_password(user.password, body_data.get("password")):
+        # upgrade the stored hash when BCRYPT_LOG_ROUNDS changed since it was created
+        if needs_rehash(user.password):
+            user.password = hash_password(body_data.get("password"))
+            db.session.commit()
+        # admin status and token version are signed into the token,
+        # so the authorisation decorators do not need to query the users table
+        claims = {"is_admin": bool(user.is_admin),
+                  "token_version": user.token_version or 0}
         token = create_access_token(identity=str(
-            user.id), expires_delta=timedelta(days=1))
+            user.id), additional_claims=claims, expires_delta=timedelta(days=1))
         return {"user_name": user.user_name, "email": user.email, "token": token}
     else:
         return {"error": "Invalid email or password"}, 401
@@ -114,8 +141,7 @@ def auth_update_user(user_id):
         update_user.email = body_data.get("email") or update_user.email
 
         if body_data.get("password"):
-            update_user.password = bcrypt.generate_password_hash(
-                body_data["password"]).decode("utf-8")
+            update_user.password = hash_password(body_data["password"])
         else:
             update_user.password = update_user.password
 
@@ -128,8 +154,15 @@ def auth_update_user(user_id):
             '''
             update_user.is_admin = body_data.get(
                 "is_admin", update_user.is_admin)
+            # tokens carry the old admin status, revoke them so the user has to login again
+            bump_token_version(update_user)
+        # gardens show the names and emails of their owners and commenters
+        bump_garden_versions(gardens_of_user(user_id))
         db.session.add(update_user)
         db.session.commit()
+        forget_token_version(user_id)
+        # cached plant payloads show the owners of the gardens they are placed in
+        invalidate_plants(*plant_ids_in_gardens(Garden.user_id == user_id))
         return update_user_schema.dump(update_user)
     except IntegrityError as err:
         db.session.rollback()
@@ -152,6 +185,11 @@ def auth_update_user(user_id):
 @authorise_as_account_owner_or_admin
 def user_delete(user_id):
     user = get_user(user_id)
+    plant_ids = plant_ids_in_gardens(Garden.user_id == user_id)
+    # the user's comments on other gardens are deleted with the user, count the others
+    bump_garden_versions(gardens_of_user(user_id), **recounted_comments(Comment.user_id != user_id))
     db.session.delete(user)
     db.session.commit()
+    forget_token_version(user_id)
+    invalidate_plants(*plant_ids)
     return {"message": f"User: '{user.email}' successfully deleted."}, 200
@@ -0,0 +1,394 @@
+import json
+import platform
+import random
+import threading
+import time
+import click
+import schema_compiler
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from flask import Blueprint, current_app
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from init import db
+from json_provider import OrjsonProvider, orjson
+from plant_cache import invalidate_catalogue
+from controllers.cli_controller import generate_seed_data
+from models.user import User
+from models.garden import Garden
+from models.plant import Plant
+from models.comment import Comment
+from models.garden_plant import GardenPlant
+from schemas.garden_schema import gardens_schema
+from schemas.plant_schema import plants_update_schema
+from schemas.user_schema import users_schema
+from query_options import schema_load_options
+from row_reads import row_columns
+from schemas.garden_plant_schema import VALID_POSITIONS
+
+bench_commands = Blueprint("bench", __name__)
+
+
+# in memory gardens shaped like the seed data, no database needed
+def sample_gardens(count, plants_per_garden=3, comments_per_garden=3):
+    owner = User(user_name="Owner", email="owner@email.com")
+    commenter = User(user_name="Commenter", email="commenter@email.com")
+    plants = [Plant(id=i, plant_name=f"Plant {i}", genus="Genus")
+              for i in range(1, plants_per_garden + 1)]
+    gardens = []
+    for i in range(1, count + 1):
+        garden = Garden(id=i, garden_name=f"Garden {i}", description="Generated garden",
+                        creation_date=date.today(), user=owner)
+        garden.garden_plants = [
+            GardenPlant(id=i * 10 + n, color="Green", position="North",
+                        size="Small", plant=plant)
+            for n, plant in enumerate(plants)
+        ]
+        garden.comments = [
+            Comment(id=i * 10 + n, message="Generated comment",
+                    comment_date=date.today(), user=commenter)
+            for n in range(comments_per_garden)
+        ]
+        gardens.append(garden)
+    return gardens
+
+
+def _rate(dump, gardens, rounds, compiled):
+    schema_compiler.COMPILED_DUMPS = compiled
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = dump(gardens)
+    elapsed = time.perf_counter() - started
+    schema_compiler.COMPILED_DUMPS = True
+    return len(gardens) * rounds / elapsed, result
+
+
+# compare marshmallow's own dump with the compiled serializers, e.g. flask bench schema --gardens 1000
+@bench_commands.cli.command("schema")
+@click.option("--gardens", type=int, default=1000)
+@click.option("--rounds", type=int, default=5)
+def bench_schema(gardens, rounds):
+    items = sample_gardens(gardens)
+
+    before, expected = _rate(gardens_schema.dump, items, rounds, compiled=False)
+    after, result = _rate(gardens_schema.dump, items, rounds, compiled=True)
+    if result != expected:
+        raise click.ClickException("compiled dump differs from marshmallow dump")
+
+    print(f"GardenSchema(many=True), {gardens} gardens x {rounds} rounds")
+    print(f"  marshmallow dump: {before:,.0f} gardens/s")
+    print(f"  compiled dump:    {after:,.0f} gardens/s ({after / before:.1f}x)")
+
+
+# compare the stdlib and orjson JSON providers on a gardens_schema payload, e.g. flask bench json --gardens 2000
+@bench_commands.cli.command("json")
+@click.option("--gardens", type=int, default=2000)
+@click.option("--rounds", type=int, default=5)
+def bench_json(gardens, rounds):
+    if orjson is None:
+        raise click.ClickException("orjson is not installed")
+    payload = gardens_schema.dump(sample_gardens(gardens))
+
+    app = current_app._get_current_object()
+    providers = {"stdlib": DefaultJSONProvider(app), "orjson": OrjsonProvider(app)}
+    print(f"gardens_schema payload, {gardens} gardens x {rounds} rounds")
+    rates = {}
+    for name, provider in providers.items():
+        provider.sort_keys = False
+        provider.compact = True
+        started = time.perf_counter()
+        for _ in range(rounds):
+            size = len(provider.response(payload).get_data())
+        rates[name] = rounds / (time.perf_counter() - started)
+        print(f"  {name}: {rates[name]:,.1f} responses/s, {size:,} bytes")
+    print(f"  orjson is {rates['orjson'] / rates['stdlib']:.1f}x faster")
+
+
+WORKLOADS = ("catalogue", "garden", "comment", "login", "placement")
+
+
+# --mix catalogue=40,garden=30 -> {"catalogue": 40, "garden": 30}
+def _parse_mix(ctx, param, value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in WORKLOADS or not weight.strip().isdigit():
+            raise click.BadParameter(f"expected name=weight pairs with names from {', '.join(WORKLOADS)}")
+        mix[name] = int(weight)
+    if not any(mix.values()):
+        raise click.BadParameter("at least one workload needs a weight above 0")
+    return mix
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def _summary(samples, elapsed):
+    latencies = sorted(sample[0] for sample in samples)
+    count = len(samples) or 1
+    return {
+        "requests": len(samples),
+        "errors": sum(not sample[2] for sample in samples),
+        "req_per_s": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50), 2),
+        "p95_ms": round(_percentile(latencies, 0.95), 2),
+        "p99_ms": round(_percentile(latencies, 0.99), 2),
+        "queries_per_request": round(sum(sample[1] for sample in samples) / count, 2),
+    }
+
+
+# the ids and accounts the workloads pick from, read from the seeded database
+class _BenchData:
+    def __init__(self, client, accounts, password):
+        self.plant_ids = db.session.scalars(db.select(Plant.id).limit(1000)).all()
+        self.garden_ids = db.session.scalars(db.select(Garden.id).limit(1000)).all()
+        users = db.session.scalars(db.select(User).where(
+            User.email.in_([f"user{n}@seed.com" for n in range(1, accounts + 1)]))).all()
+        if not users or not self.plant_ids or not self.garden_ids:
+            raise click.ClickException(
+                "no generated data found, run with --seed or seed with flask db seed --users")
+        self.logins = [{"email": user.email, "password": password} for user in users]
+
+        # log every account in once, the write workloads reuse their tokens
+        self.tokens = {}
+        for login in self.logins:
+            response = client.post("/auth/login", json=login)
+            if response.status_code != 200:
+                raise click.ClickException(f"could not login {login['email']}: {response.get_data(as_text=True)}")
+            self.tokens[login["email"]] = {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+        # one free position in each garden of the accounts, for placements that are removed again
+        self.slots = []
+        for user in users:
+            for garden in db.session.scalars(db.select(Garden).filter_by(user_id=user.id)):
+                taken = set(db.session.scalars(
+                    db.select(GardenPlant.position).filter_by(garden_id=garden.id)))
+                free = [position for position in VALID_POSITIONS if position not in taken]
+                if free:
+                    self.slots.append((self.tokens[user.email], garden.id, free[0]))
+        db.session.remove()
+
+
+# one worker thread with its own test client, placement slots are split between workers
+# so two workers never place into the same position
+class _BenchWorker:
+    def __init__(self, app, data, slots, rng):
+        self.client = app.test_client()
+        self.data = data
+        self.slots = slots
+        self.rng = rng
+        self.samples = {}
+
+    def request(self, workload, method, url, expected, **kwargs):
+        _query_count.value = 0
+        started = time.perf_counter()
+        response = getattr(self.client, method)(url, **kwargs)
+        response.get_data()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.samples.setdefault(workload, []).append(
+            (elapsed_ms, _query_count.value, response.status_code in expected))
+        return response
+
+    def catalogue(self):
+        self.request("catalogue", "get", "/plant/", (200,))
+
+    def garden(self):
+        self.request("garden", "get", f"/garden/{self.rng.choice(self.data.garden_ids)}", (200,))
+
+    def comment(self):
+        self.request("comment", "post", f"/garden/{self.rng.choice(self.data.garden_ids)}/comment/",
+                     (201, 202), json={"message": "Benchmark comment"},
+                     headers=self.rng.choice(list(self.data.tokens.values())))
+
+    def login(self):
+        self.request("login", "post", "/auth/login", (200,), json=self.rng.choice(self.data.logins))
+
+    # place a plant and remove it again, so the garden keeps its free position
+    def placement(self):
+        if not self.slots:
+            return
+        headers, garden_id, position = self.rng.choice(self.slots)
+        response = self.request(
+            "placement", "post", f"/garden/{garden_id}/plant/{self.rng.choice(self.data.plant_ids)}",
+            (201,), json={"color": "Green", "position": position, "size": "Small"}, headers=headers)
+        if response.status_code == 201:
+            garden_plant_id = response.get_json()["id"]
+            self.client.delete(f"/garden/{garden_id}/garden_plant/{garden_plant_id}", headers=headers)
+
+    def run(self, workloads):
+        for workload in workloads:
+            getattr(self, workload)()
+        return self.samples
+
+
+# statements per benchmark request, counted per thread
+_query_count = threading.local()
+
+
+def _count_query(*args):
+    _query_count.value = getattr(_query_count, "value", 0) + 1
+
+
+def _compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\nCompared with the baseline (tolerance {tolerance:.0%}):")
+    # numbers of runs on another database, concurrency or mix are not comparable
+    for key in ("database", "requests", "concurrency", "mix"):
+        if baseline.get("meta", {}).get(key) != results["meta"][key]:
+            print(f"  warning: {key} differs from the baseline ({baseline.get('meta', {}).get(key)})")
+    for name, current in results["workloads"].items():
+        before = baseline.get("workloads", {}).get(name)
+        if before is None:
+            print(f"  {name:<10} not in the baseline")
+            continue
+        checks = [
+            ("req/s", current["req_per_s"], before["req_per_s"], current["req_per_s"] < before["req_per_s"] * (1 - tolerance)),
+            ("p95 ms", current["p95_ms"], before["p95_ms"], current["p95_ms"] > before["p95_ms"] * (1 + tolerance)),
+            ("queries", current["queries_per_request"], before["queries_per_request"],
+             current["queries_per_request"] > before["queries_per_request"] * (1 + tolerance)),
+        ]
+        for label, now, then, worse in checks:
+            flag = "REGRESSION" if worse else ""
+            print(f"  {name:<10} {label:<8} {then:>10} -> {now:<10} {flag}")
+            if worse:
+                regressions.append(f"{name} {label}")
+    return regressions
+
+
+# drive a mixed workload through the app and report throughput, latency and queries per request
+# e.g. DATABASE_URL=sqlite:///bench.db flask bench run --seed --users 2000 --requests 5000 --output baseline.json
+@bench_commands.cli.command("run")
+@click.option("--seed", is_flag=True, help="Drop the tables and generate the data set first.")
+@click.option("--users", type=int, default=1000)
+@click.option("--gardens-per-user", type=int, default=2)
+@click.option("--plants", type=int, default=200)
+@click.option("--plants-per-garden", type=click.IntRange(0, len(VALID_POSITIONS) - 1), default=3)
+@click.option("--comments-per-garden", type=int, default=2)
+@click.option("--accounts", type=int, default=20, help="Generated users the write workloads log in as.")
+@click.option("--password", default="password123", help="Password of the generated users.")
+@click.option("--requests", "total", type=int, default=2000)
+@click.option("--warmup", type=int, default=100, help="Requests sent before measuring.")
+@click.option("--concurrency", type=int, default=1, help="Worker threads sending requests.")
+@click.option("--mix", callback=_parse_mix, default="catalogue=40,garden=30,comment=15,placement=10,login=5",
+              help="Workload weights.")
+@click.option("--random-seed", type=int, default=0)
+@click.option("--output", type=click.Path(dir_okay=False), help="Write the results to this JSON file.")
+@click.option("--compare", type=click.Path(exists=True, dir_okay=False), help="Baseline JSON file to compare with.")
+@click.option("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline.")
+def bench_run(seed, users, gardens_per_user, plants, plants_per_garden, comments_per_garden, accounts,
+              password, total, warmup, concurrency, mix, random_seed, output, compare, tolerance):
+    app = current_app._get_current_object()
+    if seed:
+        db.drop_all(bind_key=None)
+        db.create_all(bind_key=None)
+        generate_seed_data(users, gardens_per_user, plants, plants_per_garden,
+                           comments_per_garden, 5000, False, random_seed)
+        invalidate_catalogue()
+        db.session.remove()
+
+    data = _BenchData(app.test_client(), accounts, password)
+    if "placement" in mix and mix["placement"] and len(data.slots) < concurrency:
+        raise click.ClickException("not enough free garden positions for one placement slot per worker, "
+                                   "use more --accounts or fewer --plants-per-garden")
+
+    rng = random.Random(random_seed)
+    names = list(mix)
+    workloads = rng.choices(names, weights=[mix[name] for name in names], k=total)
+    workers = [_BenchWorker(app, data, data.slots[i::concurrency], random.Random(random_seed + i))
+               for i in range(concurrency)]
+
+    event.listen(db.engine, "before_cursor_execute", _count_query)
+    try:
+        workers[0].run(rng.choices(names, weights=[mix[name] for name in names], k=warmup))
+        workers[0].samples = {}
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(lambda index: workers[index].run(workloads[index::concurrency]),
+                                    range(concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _count_query)
+
+    samples = {}
+    for worker_samples in results:
+        for name, values in worker_samples.items():
+            samples.setdefault(name, []).extend(values)
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "database": db.engine.dialect.name,
+            "python": platform.python_version(),
+            "requests": total,
+            "concurrency": concurrency,
+            "mix": mix,
+            "bcrypt_log_rounds": app.config.get("BCRYPT_LOG_ROUNDS"),
+        },
+        "total": _summary([sample for values in samples.values() for sample in values], elapsed),
+        "workloads": {name: _summary(samples[name], elapsed) for name in names if name in samples},
+    }
+
+    print(f"{total} requests, {concurrency} worker(s), {report['meta']['database']}, {elapsed:.1f}s")
+    print(f"{'workload':<10} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for name, stats in [*report["workloads"].items(), ("total", report["total"])]:
+        print(f"{name:<10} {stats['requests']:>6} {stats['errors']:>6} {stats['req_per_s']:>8} {stats['p50_ms']:>8} "
+              f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['queries_per_request']:>8}")
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Results written to {output}")
+
+    if compare:
+        with open(compare) as file:
+            regressions = _compare(report, json.load(file), tolerance)
+        if regressions:
+            raise click.ClickException(f"regressions against {compare}: {', '.join(regressions)}")
+
+
+def _read_rate(read, rounds):
+    best = None
+    for _ in range(rounds):
+        # a new session each round, so the ORM path pays for its identity map every time
+        db.session.remove()
+        started = time.perf_counter()
+        result = read()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    db.session.remove()
+    return best, result
+
+
+# compare the ORM read path with Core rows for the flat list routes (select and dump, no HTTP),
+# e.g. flask bench rows --seed --rows 100000
+@bench_commands.cli.command("rows")
+@click.option("--seed", is_flag=True, help="Drop the tables and generate --rows plants and users first.")
+@click.option("--rows", "count", type=int, default=100000)
+@click.option("--rounds", type=int, default=3)
+def bench_rows(seed, count, rounds):
+    if seed:
+        db.drop_all(bind_key=None)
+        db.create_all(bind_key=None)
+        generate_seed_data(count, 0, count, 0, 0, 5000, False, 0)
+        invalidate_catalogue()
+        db.session.remove()
+
+    print(f"select and dump of every row, best of {rounds} rounds, {db.engine.dialect.name}")
+    for model, schema in ((Plant, plants_update_schema), (User, users_schema)):
+        orm_stmt = db.select(model).options(*schema_load_options(model, schema)).order_by(model.id)
+        row_stmt = db.select(*row_columns(model, schema)).order_by(model.id)
+        orm_time, expected = _read_rate(lambda: schema.dump(db.session.scalars(orm_stmt).all()), rounds)
+        row_time, result = _read_rate(lambda: schema.dump(db.session.execute(row_stmt).all()), rounds)
+        if result != expected:
+            raise click.ClickException(f"{model.__name__} rows dump differs from the ORM dump")
+
+        total = len(result)
+        print(f"{model.__name__}, {total:,} rows")
+        print(f"  ORM objects: {orm_time * 1000:,.0f} ms ({total / orm_time:,.0f} rows/s)")
+        print(f"  Core rows:   {row_time * 1000:,.0f} ms ({total / row_time:,.0f} rows/s, {orm_time / row_time:.1f}x)")
@@ -1,32 +1,118 @@
-from flask import Blueprint
+import random
+import time
+import click
+import bcrypt as bcrypt_lib
+from concurrent.futures import ProcessPoolExecutor
+from flask import Blueprint, current_app
+from sqlalchemy import insert, exc
 from init import db, bcrypt
 from models.user import User
 from models.garden import Garden
 from models.plant import Plant
 from models.comment import Comment
 from models.garden_plant import GardenPlant
-from datetime import date
+from schemas.garden_plant_schema import VALID_COLORS, VALID_POSITIONS, VALID_SIZES
+from schemas.plant_schema import VALID_WATERING, VALID_GROWTH_RATE
+from garden_versions import recount_gardens
+from db_upgrade import upgrade_db, UpgradeError
+from datetime import date, timedelta
 
 db_commands = Blueprint("db", __name__)
 
 
 # create tables
+# on the primary only, the read replicas get them through replication
 @db_commands.cli.command("create")
 def create_db():
-    db.create_all()
+    db.create_all(bind_key=None)
     print("Tables Created")
 
 
 # drop tables
 @db_commands.cli.command("drop")
 def drop_db():
-    db.drop_all()
+    db.drop_all(bind_key=None)
     print("Tables dropped")
 
 
+# add the columns, indexes and constraints of the models to tables created before they were declared,
+# e.g. the ON DELETE CASCADE foreign keys, db create only creates missing tables
+# on the primary only, the read replicas get them through replication
+@db_commands.cli.command("upgrade")
+def upgrade_db_command():
+    try:
+        upgraded = upgrade_db()
+    except (UpgradeError, exc.IntegrityError) as err:
+        raise click.ClickException(f"Upgrade failed, nothing was changed: {err}")
+    if not upgraded:
+        print("Tables are up to date")
+    for table, changes in upgraded.items():
+        for change in changes:
+            print(f"Upgraded {table}: {change}")
+
+
+# count the garden_plants and comments of every garden again, e.g. after editing rows by hand
+@db_commands.cli.command("recount")
+def recount_db():
+    recount_gardens()
+    db.session.commit()
+    print("Garden counters updated")
+
+
+# run EXPLAIN on the queries the routes send most often, to check they use the indexes
+# e.g. flask db index-report --garden-id 1 --user-id 2 --plant-id 3
+@db_commands.cli.command("index-report")
+@click.option("--garden-id", type=int, default=1)
+@click.option("--user-id", type=int, default=1)
+@click.option("--plant-id", type=int, default=1)
+def index_report(garden_id, user_id, plant_id):
+    queries = {
+        "comments of a garden": db.select(Comment).filter_by(garden_id=garden_id)
+        .order_by(Comment.comment_date.desc(), Comment.id.desc()).limit(50),
+        "garden_plants of a garden": db.select(GardenPlant).filter_by(garden_id=garden_id)
+        .order_by(GardenPlant.id).limit(50),
+        "position check": db.select(GardenPlant).filter_by(garden_id=garden_id, position="Center"),
+        "gardens page": db.select(Garden).order_by(Garden.id.desc()).limit(50),
+        "gardens of a user (cascade delete)": db.select(Garden).filter_by(user_id=user_id),
+        "comments of a user (cascade delete)": db.select(Comment).filter_by(user_id=user_id),
+        "garden_plants of a plant (cascade delete)": db.select(GardenPlant).filter_by(plant_id=plant_id),
+        "login by email": db.select(User).filter_by(email="admin@admin.com"),
+    }
+
+    # sqlite only explains the query plan, postgres gives the costs as well
+    dialect = db.engine.dialect
+    explain = "EXPLAIN QUERY PLAN" if dialect.name == "sqlite" else "EXPLAIN"
+
+    for name, stmt in queries.items():
+        sql = stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+        plan = db.session.execute(db.text(f"{explain} {sql}")).all()
+        print(f"-- {name}")
+        for row in plan:
+            # postgres returns one text column, sqlite returns (id, parent, notused, detail)
+            print(f"   {row[-1]}")
+        print()
+
+
 # seed tables
+# without options seed the small demo data set,
+# with --users generate a load test data set, e.g. flask db seed --users 100000 --gardens-per-user 5
 @db_commands.cli.command("seed")
-def seed_db():
+@click.option("--users", type=int, default=0, help="Number of users to generate.")
+@click.option("--gardens-per-user", type=int, default=2)
+@click.option("--plants", type=int, default=100, help="Size of the plant catalogue.")
+@click.option("--plants-per-garden", type=click.IntRange(0, len(VALID_POSITIONS)), default=3)
+@click.option("--comments-per-garden", type=int, default=2)
+@click.option("--batch-size", type=int, default=5000, help="Users inserted per transaction.")
+@click.option("--unique-passwords", is_flag=True,
+              help="Hash 'user<n>pw' for every user in a process pool instead of sharing one hash of 'password123'.")
+@click.option("--random-seed", type=int, default=0)
+def seed_db(users, gardens_per_user, plants, plants_per_garden, comments_per_garden,
+            batch_size, unique_passwords, random_seed):
+    if users:
+        generate_seed_data(users, gardens_per_user, plants, plants_per_garden,
+                           comments_per_garden, batch_size, unique_passwords, random_seed)
+        return
+
     users = [
         User(
             user_name="Admin1",
@@ -189,7 +275,117 @@ def seed_db():
         ),
     ]
     db.session.add_all(comments)
+    db.session.flush()
+    # the garden counters are written by the routes, count the seeded children once
+    recount_gardens()
+
+    db.session.commit()
+
+    print("Tables seeded")
 
+
+def _hash_password(password, rounds):
+    return bcrypt_lib.hashpw(password.encode("utf-8"), bcrypt_lib.gensalt(rounds)).decode("utf-8")
+
+
+# insert rows as one executemany (multi-row INSERT ... VALUES batches), returning the new ids in order
+def _bulk_insert(model, rows):
+    # an empty parameter list would insert one row of defaults, e.g. with --gardens-per-user 0
+    if not rows:
+        return []
+    stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+    return list(db.session.scalars(stmt, rows))
+
+
+# generate a load test data set with set based inserts, committed per batch of users
+def generate_seed_data(users, gardens_per_user, plants, plants_per_garden, comments_per_garden,
+                       batch_size, unique_passwords, random_seed):
+    rng = random.Random(random_seed)
+    rounds = current_app.config.get("BCRYPT_LOG_ROUNDS", 12)
+    started = time.perf_counter()
+    today = date.today()
+
+    # the plant catalogue first, gardens pick their plants from it
+    plant_ids = _bulk_insert(Plant, [
+        {
+            "plant_name": f"Plant {i}",
+            "genus": f"Genus {i % 50}",
+            "watering": rng.choice(VALID_WATERING),
+            "growth_rate": rng.choice(VALID_GROWTH_RATE),
+        }
+        for i in range(1, plants + 1)
+    ])
     db.session.commit()
 
+    # hashing the same password for every user is the slow part, by default hash once and share it
+    shared_hash = None if unique_passwords else _hash_password("password123", rounds)
+    user_ids = []
+    rows_inserted = len(plant_ids)
+
+    with ProcessPoolExecutor() as pool:
+        for start in range(1, users + 1, batch_size):
+            numbers = range(start, min(start + batch_size, users + 1))
+            if unique_passwords:
+                passwords = list(pool.map(
+                    _hash_password, [f"user{n}pw" for n in numbers],
+                    [rounds] * len(numbers), chunksize=64))
+            else:
+                passwords = [shared_hash] * len(numbers)
+
+            batch_user_ids = _bulk_insert(User, [
+                # user1 is the admin of the generated data set
+                {"user_name": f"user{n}", "email": f"user{n}@seed.com",
+                    "password": password, "is_admin": n == 1}
+                for n, password in zip(numbers, passwords)
+            ])
+            user_ids.extend(batch_user_ids)
+
+            garden_ids = _bulk_insert(Garden, [
+                {
+                    "garden_name": f"Garden {user_id} {g}",
+                    "description": f"Generated garden {g} of user {user_id}",
+                    "creation_date": today - timedelta(days=rng.randrange(365)),
+                    "user_id": user_id,
+                }
+                for user_id in batch_user_ids
+                for g in range(1, gardens_per_user + 1)
+            ])
+
+            garden_plants = [
+                {
+                    "garden_id": garden_id,
+                    "plant_id": rng.choice(plant_ids),
+                    "position": position,
+                    "color": rng.choice(VALID_COLORS),
+                    "size": rng.choice(VALID_SIZES),
+                }
+                for garden_id in garden_ids
+                for position in rng.sample(VALID_POSITIONS, plants_per_garden)
+            ] if plant_ids else []
+
+            comments = [
+                {
+                    "garden_id": garden_id,
+                    "user_id": rng.choice(user_ids),
+                    "message": f"Generated comment {c} on garden {garden_id}",
+                    "comment_date": today - timedelta(days=rng.randrange(365)),
+                }
+                for garden_id in garden_ids
+                for c in range(1, comments_per_garden + 1)
+            ]
+
+            # child rows do not need their ids back, a plain executemany is enough
+            if garden_plants:
+                db.session.execute(insert(GardenPlant), garden_plants)
+            if comments:
+                db.session.execute(insert(Comment), comments)
+            if garden_ids:
+                recount_gardens(Garden.id.between(garden_ids[0], garden_ids[-1]))
+            db.session.commit()
+
+            rows_inserted += len(batch_user_ids) + len(garden_ids) + \
+                len(garden_plants) + len(comments)
+            print(f"{len(user_ids)}/{users} users, {rows_inserted} rows, "
+                  f"{time.perf_counter() - started:.1f}s")
+
     print("Tables seeded")
@@ -5,6 +5,13 @@ from datetime import date
 from schemas.comment_schema import comment_schema, comments_schema, update_comment_schema
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from auth_deco import get_comment, get_garden, is_admin_or_comment_owner
+from query_options import schema_load_options
+from pagination import paginate, page_headers
+from streaming import stream_requested, stream_dump
+from search import search, search_terms
+from projection import project
+from garden_versions import bump_garden_version, comments_added, recounted_comments
+from comment_ingestion import comment_ingestor
 
 
 comment_bp = Blueprint("comment", __name__)
@@ -22,6 +29,12 @@ def create_comment(garden_id):
     garden = get_garden(garden_id)
 
     if garden:
+        # batched ingestion: queue the comment and answer before it is written
+        if comment_ingestor.enabled:
+            provisional_id = comment_ingestor.submit(
+                body_data.get("message"), get_jwt_identity(), garden_id)
+            return {"provisional_id": provisional_id, "message": body_data.get("message"), "status": "queued"}, 202
+
         # create new comment
         comment = Comment(
             message=body_data.get("message"),
@@ -30,6 +43,7 @@ def create_comment(garden_id):
             garden_id=garden_id
         )
         db.session.add(comment)
+        bump_garden_version(garden_id, **comments_added(comment.comment_date))
         db.session.commit()
         return comment_schema.dump(comment), 201
     else:
@@ -47,17 +61,43 @@ def get_comments_by_garden_id(garden_id):
     if not garden:
         return {"error": f"Garden id:'{garden_id}' not found"}, 404
 
-    # get all comments by garden id
-    comment = Comment.query.filter_by(
-        garden_id=garden_id).order_by(Comment.comment_date.desc()).all()
+    # get comments by garden id, newest first, paginated with ?limit=&after=
+    # comment id breaks ties between comments posted on the same date
+    # ?fields= and ?include= narrow the dump and the query
+    schema = project(comments_schema)
+    stmt = db.select(Comment).options(
+        *schema_load_options(Comment, schema)).filter_by(garden_id=garden_id)
+    # ?stream=true streams every comment of the garden instead of one page
+    if stream_requested():
+        return stream_dump(stmt.order_by(Comment.comment_date.desc(), Comment.id.desc()), schema)
+    comment, next_cursor = paginate(
+        stmt, Comment.comment_date, Comment.id, descending=True)
 
     # if comments found return comments, else return message
-    if comment:
-        return comments_schema.dump(comment), 200
+    if comment or request.args.get("after"):
+        return schema.dump(comment), 200, page_headers(next_cursor)
     else:
         return {"message": f"No comment found for garden id '{garden_id}'"}, 200
 
 
+# garden/garden_id/comment/search?q= -search comments of a garden by message route
+# only login user can search the comments of a garden
+@comment_bp.route("/search", methods=["GET"])
+@jwt_required()
+def search_comments(garden_id):
+
+    # check if garden id exists or not
+    garden = get_garden(garden_id)
+    if not garden:
+        return {"error": f"Garden id:'{garden_id}' not found"}, 404
+
+    schema = project(comments_schema)
+    # best matches first, paginated with ?limit=&after=
+    comments, next_cursor = search(Comment, search_terms(), Comment.garden_id == garden_id,
+                                   options=schema_load_options(Comment, schema))
+    return schema.dump(comments), 200, page_headers(next_cursor)
+
+
 # garden/garden_id/comment/comment_id -put route
 # only login comment owner and admin can update comment by comment id
 @comment_bp.route("/<int:comment_id>", methods=["PUT", "PATCH"])
@@ -79,6 +119,7 @@ def update_comment(garden_id, comment_id):
     if comment:
         if is_admin_or_comment_owner(comment, user_id):
             comment.message = body_data.get("message") or comment.message
+            bump_garden_version(garden_id)
             db.session.commit()
             return update_comment_schema.dump(comment), 200
         else:
@@ -108,6 +149,8 @@ def delete_comment(garden_id, comment_id):
     if comment:
         if is_admin_or_comment_owner(comment, user_id):
             db.session.delete(comment)
+            # the deleted comment may have been the latest one
+            bump_garden_version(garden_id, **recounted_comments(Comment.id != comment_id))
             db.session.commit()
             return {"message": f"Comment message:'{comment.message}' was deleted successfully"}, 200
         else:
@@ -1,39 +1,82 @@
-from flask import Blueprint, request
+from flask import Blueprint, request, abort
 from init import db
 from sqlalchemy.exc import IntegrityError
 from psycopg2 import errorcodes
 from models.garden import Garden
 from datetime import date
-from schemas.garden_schema import garden_schema, gardens_schema, garden_update_schema
+from schemas.garden_schema import garden_schema, gardens_schema, garden_update_schema, gardens_summary_schema
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from controllers.garden_plants_controller import garden_plant_bp
 from controllers.comment_controller import comment_bp
 from auth_deco import get_garden, authorise_as_admin_or_garden_owner
+from query_options import schema_load_options
+from plant_cache import invalidate_plants, plant_ids_in_gardens
+from garden_versions import garden_etag, etag_header, is_not_modified, bump_garden_version
+from pagination import paginate, page_headers
+from streaming import stream_requested, stream_dump
+from search import search, search_terms
+from projection import project
 
 garden_bp = Blueprint("garden", __name__, url_prefix="/garden")
 garden_bp.register_blueprint(
     garden_plant_bp, url_prefix="/<int:garden_id>")
 garden_bp.register_blueprint(comment_bp, url_prefix="/<int:garden_id>/comment")
 
+# ?view= of the garden lists, summary has the child counters instead of the garden_plants and comments arrays
+LIST_VIEWS = {"full": gardens_schema, "summary": gardens_summary_schema}
+
+
+def list_schema():
+    view = request.args.get("view", "full")
+    if view not in LIST_VIEWS:
+        abort(400, description=f"'view' must be one of {', '.join(LIST_VIEWS)}")
+    return LIST_VIEWS[view]
+
 
 # garden/-get all gardens route
 # all visitors can access this route
 @garden_bp.route("/", methods=["GET"])
 def get_all_gardens():
-    stmt = db.select(Garden).order_by(Garden.id.desc())
-    gardens = db.session.scalars(stmt)
-    return gardens_schema.dump(gardens), 200
+    # ?fields= and ?include= narrow the view further
+    schema = project(list_schema())
+    # eager load everything the schema dumps, so the query count does not grow with the number of gardens
+    # (nothing for the summary, it only reads the gardens table)
+    stmt = db.select(Garden).options(
+        *schema_load_options(Garden, schema))
+    # ?stream=true streams every garden instead of one page
+    if stream_requested():
+        return stream_dump(stmt.order_by(Garden.id.desc()), schema)
+    # paginated with ?limit=&after=, newest gardens first
+    gardens, next_cursor = paginate(stmt, Garden.id, descending=True)
+    return schema.dump(gardens), 200, page_headers(next_cursor)
+
+
+# garden/search?q= -search gardens by name and description route
+# all visitors can access this route
+@garden_bp.route("/search", methods=["GET"])
+def search_gardens():
+    schema = project(list_schema())
+    # best matches first, paginated with ?limit=&after=
+    gardens, next_cursor = search(Garden, search_terms(),
+                                  options=schema_load_options(Garden, schema))
+    return schema.dump(gardens), 200, page_headers(next_cursor)
 
 
 # garden/garden_id-get garden by id route
 # all users can get the garden by id
 @garden_bp.route("/<int:id>", methods=["GET"])
 def get_garden_by_id(id):
-    garden = get_garden(id)
-    if garden:
-        return garden_schema.dump(garden), 200
-    else:
+    # check the garden version first, an unchanged garden is answered without loading or dumping it
+    etag = garden_etag(id)
+    if etag is None:
         return {"error": f"Garden id:'{id}' not found"}, 404
+    if is_not_modified(etag):
+        return "", 304, etag_header(etag)
+
+    # ?fields= and ?include= choose the columns and relationships
+    schema = project(garden_schema)
+    garden = get_garden(id, *schema_load_options(Garden, schema))
+    return schema.dump(garden), 200, etag_header(etag)
 
 
 # garden/ -post garden route
@@ -80,7 +123,10 @@ def update_garden(garden_id):
                 "garden_name") or garden.garden_name
             garden.description = body_data.get(
                 "description") or garden.description
+            bump_garden_version(garden_id)
             db.session.commit()
+            # cached plant payloads show the garden name
+            invalidate_plants(*plant_ids_in_gardens(Garden.id == garden_id))
             return garden_update_schema.dump(garden), 200
     except IntegrityError as err:
         if err.orig.pgcode == errorcodes.UNIQUE_VIOLATION:
@@ -98,6 +144,8 @@ def delete_garden(garden_id):
     if not garden:
         return {"error": f"Garden id:'{garden_id}' not found"}, 404
 
+    plant_ids = plant_ids_in_gardens(Garden.id == garden_id)
     db.session.delete(garden)
     db.session.commit()
+    invalidate_plants(*plant_ids)
     return {"message": f"Garden name:'{garden.garden_name}' successfully deleted"}, 200
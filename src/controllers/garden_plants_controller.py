@@ -1,12 +1,18 @@
 from flask import Blueprint, request
 from init import db
-from models.garden import Garden
+from marshmallow.exceptions import ValidationError
 from flask_jwt_extended import jwt_required
 from schemas.garden_plant_schema import garden_plant_schema, garden_plants_schema
 from models.garden_plant import GardenPlant
+from auth_deco import authorise_as_admin_or_garden_owner, get_garden_plant, get_garden, get_plant
+from schemas.garden_plant_schema import is_position_occupied, position_occupied_error, VALID_POSITIONS
 from models.plant import Plant
-from auth_deco import authorise_as_admin_or_garden_owner, get_garden_plant, get_garden
-from schemas.garden_plant_schema import validate_position
+from query_options import schema_load_options
+from plant_cache import invalidate_plants
+from garden_versions import garden_etag, etag_header, is_not_modified, bump_garden_version, plants_added, plant_removed
+from pagination import paginate, page_headers
+from streaming import stream_requested, stream_dump
+from projection import project
 from sqlalchemy.exc import IntegrityError
 from psycopg2 import errorcodes
 
@@ -23,11 +29,9 @@ def create_garden_plants(garden_id, plant_id):
     try:
         body_data = garden_plant_schema.load(request.get_json())
 
-        # check if the position is been taken in this garden
-        validate_position(garden_id, body_data.get("position"))
-
-        garden = db.session.query(Garden).get(garden_id)
-        plant = db.session.query(Plant).get(plant_id)
+        # garden is already loaded by the authorisation decorator
+        garden = get_garden(garden_id)
+        plant = get_plant(plant_id)
 
         # if garden and plant exists, create new garden_plant
         if garden and plant:
@@ -39,29 +43,123 @@ def create_garden_plants(garden_id, plant_id):
                 plant_id=plant_id,
             )
             db.session.add(garden_plant)
+            bump_garden_version(garden_id, **plants_added())
             db.session.commit()
+            # the plant payload lists the gardens it is placed in
+            invalidate_plants(plant_id)
             return garden_plant_schema.dump(garden_plant), 201
         else:
             return {"error": f"Plant id {plant_id} not found"}, 404
     except IntegrityError as err:
+        db.session.rollback()
+        # the unique constraint rejects a taken position in the same statement as the insert,
+        # so two requests for the same position can not both succeed
+        if is_position_occupied(err):
+            return position_occupied_error(body_data.get("position"))
         if err.orig.pgcode == errorcodes.NOT_NULL_VIOLATION:
             column_name = err.orig.diag.column_name
             return {"error": f"{column_name} is required."}, 401
 
 
+# garden/garden_id/garden_plants -post route
+# place several plants in one request, body is a list of {"plant_id", "position", "color", "size"}
+# every item is validated, plants and occupied positions are checked with one query each,
+# valid items are inserted in one transaction and invalid ones are reported by index
+@garden_plant_bp.route("/garden_plants", methods=["POST"])
+@jwt_required()
+@authorise_as_admin_or_garden_owner
+def create_garden_plants_bulk(garden_id):
+    items = request.get_json()
+    if not isinstance(items, list) or not items:
+        return {"error": "Please provide a list of garden_plants"}, 400
+    if len(items) > len(VALID_POSITIONS):
+        return {"error": f"A garden has {len(VALID_POSITIONS)} positions, got {len(items)} garden_plants"}, 400
+
+    errors = []
+    placements = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "Invalid garden_plant"})
+            continue
+        item = dict(item)
+        plant_id = item.pop("plant_id", None)
+        try:
+            body_data = garden_plant_schema.load(item)
+        except ValidationError as err:
+            errors.append({"index": index, "error": err.messages})
+            continue
+        if plant_id is None:
+            errors.append({"index": index, "error": "'plant_id' is required"})
+        # JSON true / false are ints in python
+        elif isinstance(plant_id, bool) or not isinstance(plant_id, int):
+            errors.append({"index": index, "error": "'plant_id' must be an integer"})
+        elif not body_data.get("position"):
+            errors.append({"index": index, "error": "'position' is required"})
+        else:
+            placements.append((index, plant_id, body_data))
+
+    # one IN query each for the plants and the positions already taken in this garden
+    plants = {plant.id: plant for plant in db.session.scalars(
+        db.select(Plant).where(Plant.id.in_({plant_id for _, plant_id, _ in placements})))}
+    occupied = set(db.session.scalars(
+        db.select(GardenPlant.position).filter_by(garden_id=garden_id).where(
+            GardenPlant.position.in_({body_data["position"] for _, _, body_data in placements}))))
+
+    garden_plants = []
+    for index, plant_id, body_data in placements:
+        position = body_data["position"]
+        if plant_id not in plants:
+            errors.append({"index": index, "error": f"Plant id {plant_id} not found"})
+        elif position in occupied:
+            errors.append({"index": index, "error": f"Position '{position}' already been occupied"})
+        else:
+            # later items can not take a position used by an earlier one
+            occupied.add(position)
+            garden_plants.append(GardenPlant(
+                garden_id=garden_id, plant=plants[plant_id], **body_data))
+
+    errors.sort(key=lambda error: error["index"])
+    if not garden_plants:
+        return {"created": [], "errors": errors}, 400
+
+    try:
+        db.session.add_all(garden_plants)
+        bump_garden_version(garden_id, **plants_added(len(garden_plants)))
+        # dump after the flush assigned the ids, the plants are already loaded
+        created = garden_plants_schema.dump(garden_plants)
+        db.session.commit()
+    except IntegrityError as err:
+        db.session.rollback()
+        # a concurrent request took one of the positions after the check
+        if is_position_occupied(err):
+            return {"error": "A position was occupied by another request, please try again"}, 409
+        raise
+    invalidate_plants(*plants)
+    return {"created": created, "errors": errors}, 201
+
+
 # garden/garden_id/garden_plant -get route
 # get all garden_plants from a garden
 # all visitors can get garden_plants from any garden
 @garden_plant_bp.route("/garden_plants", methods=["GET"])
 def get_garden_plants(garden_id):
-    garden = get_garden(garden_id)
-    if not garden:
+    # the garden version also covers its garden_plants, answer unchanged ones with 304
+    etag = garden_etag(garden_id)
+    if etag is None:
         return {"error": f"Garden id:'{garden_id}' not found"}, 404
 
-    garden_plants = GardenPlant.query.filter_by(
-        garden_id=garden_id).order_by(GardenPlant.id).all()
-    if garden_plants:
-        return garden_plants_schema.dump(garden_plants), 200
+    # paginated with ?limit=&after=, ?fields= and ?include= narrow the dump and the query
+    schema = project(garden_plants_schema)
+    stmt = db.select(GardenPlant).options(
+        *schema_load_options(GardenPlant, schema)).filter_by(garden_id=garden_id)
+    # ?stream=true streams every garden_plant of the garden instead of one page
+    if stream_requested():
+        return stream_dump(stmt.order_by(GardenPlant.id), schema)
+    if is_not_modified(etag):
+        return "", 304, etag_header(etag)
+    garden_plants, next_cursor = paginate(stmt, GardenPlant.id)
+    if garden_plants or request.args.get("after"):
+        return schema.dump(garden_plants), 200, {**page_headers(next_cursor), **etag_header(etag)}
     else:
         return {"error": f"No garden_plants found in garden id: '{garden_id}'"}, 404
 
@@ -80,19 +178,21 @@ def update_garden_plant(garden_id, garden_plant_id):
     if not garden_plant:
         return {"error": f"GardenPlant id '{garden_plant_id}' not found in garden id '{garden_id}'"}, 404
 
-    '''
-    check if the request position has been changed compared to the current position
-    if not changed, no need to validate, update garden_plant attributes
-    '''
-    requested_position = body_data.get("position")
-    if requested_position != garden_plant.position:
-        validate_position(garden_id, requested_position)
-
     # Update garden_plant attributes
+    # a position taken by another garden_plant is rejected by the unique constraint on commit
     garden_plant.color = body_data.get("color", garden_plant.color)
     garden_plant.position = body_data.get("position", garden_plant.position)
     garden_plant.size = body_data.get("size", garden_plant.size)
-    db.session.commit()
+    try:
+        # the version update flushes the changes first, so a taken position can be raised here too
+        bump_garden_version(garden_id)
+        db.session.commit()
+    except IntegrityError as err:
+        db.session.rollback()
+        if is_position_occupied(err):
+            return position_occupied_error(body_data.get("position"))
+        raise
+    invalidate_plants(garden_plant.plant_id)
     return garden_plant_schema.dump(garden_plant), 200
 
 
@@ -107,7 +207,9 @@ def delete_garden_plants(garden_id, garden_plant_id):
     garden_plant = get_garden_plant(garden_plant_id, garden_id)
     if garden_plant:
         db.session.delete(garden_plant)
+        bump_garden_version(garden_id, **plant_removed())
         db.session.commit()
+        invalidate_plants(garden_plant.plant_id)
         return {"message": f"GardenPlant id: '{garden_plant_id}' successfully deleted from garden id: '{garden_id}'"}, 200
     else:
         return {"error": f"GardenPlant id: '{garden_plant_id}' not found in garden id: '{garden_id}'"}, 404
@@ -1,11 +1,21 @@
 from flask import Blueprint, request
-from init import db
+from init import db, cache
 from sqlalchemy.exc import IntegrityError
 from psycopg2 import errorcodes
 from models.plant import Plant
 from schemas.plant_schema import plant_schema, plant_update_schema, plants_update_schema
 from flask_jwt_extended import jwt_required
 from auth_deco import authorise_as_admin, get_plant
+from query_options import schema_load_options
+from pagination import paginate, page_headers, page_args
+from streaming import stream_requested, stream_dump
+from models.garden_plant import GardenPlant
+from garden_versions import bump_garden_versions, gardens_with_plant, recounted_plants
+from search import search, search_terms
+from projection import project, projection_key
+from row_reads import read_statement
+from replicas import use_primary
+from plant_cache import catalogue_key, plant_key, to_json, json_response, invalidate_catalogue, invalidate_plants
 
 
 plant_bp = Blueprint("plant", __name__, url_prefix="/plant")
@@ -15,18 +25,59 @@ plant_bp = Blueprint("plant", __name__, url_prefix="/plant")
 # all visitors can access this route
 @plant_bp.route("/", methods=["GET"])
 def get_all_plants():
-    stmt = db.select(Plant).order_by(Plant.id)
-    plants = db.session.scalars(stmt)
-    return plants_update_schema.dump(plants), 200
+    # ?fields= narrows the dump and the loaded columns
+    schema = project(plants_update_schema)
+    # the catalogue is flat, it is read as Core rows (see row_reads.py)
+    stmt, rows = read_statement(Plant, schema)
+    # ?stream=true streams every plant instead of one page
+    if stream_requested():
+        return stream_dump(stmt.order_by(Plant.id), schema, rows=rows)
+    # pages are cached as "<next cursor>\n<json body>", a hit skips the query and the dump
+    key = catalogue_key(*page_args(), projection_key())
+    cached = cache.get(key)
+    if cached is not None:
+        next_cursor, body = cached.split("\n", 1)
+        return json_response(body, page_headers(next_cursor))
+
+    # the page is cached, so it is read from the primary
+    use_primary(db.session)
+    # paginated with ?limit=&after=
+    plants, next_cursor = paginate(stmt, Plant.id, rows=rows)
+    body = to_json(schema.dump(plants))
+    cache.set(key, f"{next_cursor or ''}\n{body}")
+    return json_response(body, page_headers(next_cursor))
+
+
+# plant/search?q= -search plants by name and genus route
+# all visitors can access this route
+@plant_bp.route("/search", methods=["GET"])
+def search_plants():
+    schema = project(plants_update_schema)
+    # best matches first, paginated with ?limit=&after=
+    plants, next_cursor = search(Plant, search_terms(), options=schema_load_options(Plant, schema))
+    return schema.dump(plants), 200, page_headers(next_cursor)
 
 
 # get a plant by id -get route
 # all visitors can access this route
 @plant_bp.route("/<int:id>", methods=["GET"])
 def get_plant_by_id(id):
-    plant = get_plant(id)
+    # only the full plant is cached, a ?fields= projection is read from the database
+    schema = project(plant_schema)
+    if schema is plant_schema:
+        cached = cache.get(plant_key(id))
+        if cached is not None:
+            return json_response(cached)
+
+        # the full plant is cached, so it is read from the primary
+        use_primary(db.session)
+
+    plant = get_plant(id, *schema_load_options(Plant, schema))
     if plant:
-        return plant_schema.dump(plant), 200
+        body = to_json(schema.dump(plant))
+        if schema is plant_schema:
+            cache.set(plant_key(id), body)
+        return json_response(body)
     else:
         return {"message": f"Plant id:'{id}' not found"}, 404
 
@@ -47,6 +98,7 @@ def create_plant():
         )
         db.session.add(plant)
         db.session.commit()
+        invalidate_catalogue()
         return plant_update_schema.dump(plant), 201
     except IntegrityError as err:
         if err.orig.pgcode == errorcodes.UNIQUE_VIOLATION:
@@ -70,7 +122,11 @@ def update_plant(id):
             plant.watering = body_data.get("watering") or plant.watering
             plant.growth_rate = body_data.get(
                 "growth_rate") or plant.growth_rate
+            # gardens show the names of their plants
+            bump_garden_versions(gardens_with_plant(id))
             db.session.commit()
+            invalidate_catalogue()
+            invalidate_plants(id)
             return plant_update_schema.dump(plant), 200
         else:
             return {"message": f"Plant id:'{id}' not found"}, 404
@@ -88,8 +144,12 @@ def update_plant(id):
 def delete_plant(id):
     plant = get_plant(id)
     if plant:
+        # the plant's garden_plants are deleted with it by the database, count the others
+        bump_garden_versions(gardens_with_plant(id), **recounted_plants(GardenPlant.plant_id != id))
         db.session.delete(plant)
         db.session.commit()
+        invalidate_catalogue()
+        invalidate_plants(id)
         return {"message": f"Plant name: '{plant.plant_name}' deleted successfully"}, 200
     else:
         return {"message": f"Plant id:'{id}' not found"}, 404
@@ -0,0 +1,55 @@
+import json
+import click
+from urllib.error import URLError
+from urllib.request import urlopen
+from flask import Blueprint
+
+profile_commands = Blueprint("profile", __name__)
+
+SORT_KEYS = {
+    "requests": lambda stats: stats["requests"],
+    "p95": lambda stats: stats["latency_ms"]["p95"],
+    "queries": lambda stats: stats["queries_per_request"],
+    "sql": lambda stats: stats["sql_ms_per_request"],
+}
+
+
+def _fetch(url):
+    try:
+        with urlopen(url, timeout=10) as response:
+            return json.load(response)
+    except URLError as err:
+        raise click.ClickException(f"Could not read {url}: {err.reason}")
+
+
+# print the request profile of a running server (started with PROFILING=true)
+# e.g. flask profile dump --url http://localhost:8080 --sort queries
+@profile_commands.cli.command("dump")
+@click.option("--url", default="http://localhost:8080")
+@click.option("--sort", "sort_by", type=click.Choice(list(SORT_KEYS)), default="requests")
+@click.option("--profiles", is_flag=True, help="Print the sampled cProfile captures as well")
+@click.option("--json", "as_json", is_flag=True, help="Print the raw metrics as JSON")
+def dump_profile(url, sort_by, profiles, as_json):
+    metrics = _fetch(url.rstrip("/") + "/metrics/requests")
+    if profiles:
+        metrics["profiles"] = _fetch(url.rstrip("/") + "/metrics/requests/profiles")["profiles"]
+    if as_json:
+        print(json.dumps(metrics, indent=2))
+        return
+    if not metrics["enabled"]:
+        raise click.ClickException("Profiling is off, start the server with PROFILING=true")
+
+    endpoints = sorted(metrics["endpoints"].items(), key=lambda item: SORT_KEYS[sort_by](item[1]),
+                       reverse=True)
+    print(f"{'endpoint':<45} {'reqs':>6} {'p50':>6} {'p95':>6} {'p99':>6} "
+          f"{'queries':>8} {'sql ms':>7} {'dump ms':>8} {'n+1':>4}")
+    for name, stats in endpoints:
+        latency = stats["latency_ms"]
+        print(f"{name:<45} {stats['requests']:>6} {latency['p50']:>6} {latency['p95']:>6} {latency['p99']:>6} "
+              f"{stats['queries_per_request']:>8} {stats['sql_ms_per_request']:>7} "
+              f"{stats['dump_ms_per_request']:>8} {stats['n_plus_one_requests']:>4}")
+
+    for flag in metrics["n_plus_one"]:
+        print(f"\nN+1 on {flag['path']} ({flag['endpoint']}), {flag['repeats']} times:\n  {flag['statement']}")
+    for capture in metrics.get("profiles", []):
+        print(f"\ncProfile of {capture['path']} ({capture['elapsed_ms']} ms)\n{capture['profile']}")
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+# pool settings read from the environment, only the ones that are set are passed to the engine
+POOL_SETTINGS = {
+    "pool_size": ("DB_POOL_SIZE", int),
+    "max_overflow": ("DB_MAX_OVERFLOW", int),
+    "pool_timeout": ("DB_POOL_TIMEOUT", float),
+    "pool_recycle": ("DB_POOL_RECYCLE", int),
+}
+
+
+def _is_true(value):
+    return value.lower() in ("1", "true", "yes")
+
+
+# SQLALCHEMY_ENGINE_OPTIONS for the database uri
+# pre ping is on by default so connections dropped by a postgres restart are replaced on checkout
+# instead of failing the request that gets them
+def engine_options(database_uri):
+    options = {"pool_pre_ping": _is_true(os.environ.get("DB_POOL_PRE_PING", "true"))}
+    # in memory sqlite runs on a single connection, pool sizing does not apply
+    if not database_uri:
+        return options
+    url = make_url(database_uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+
+    for option, (name, cast) in POOL_SETTINGS.items():
+        value = os.environ.get(name)
+        if value:
+            options[option] = cast(value)
+    options["poolclass"] = TimedQueuePool
+    return options
+
+
+# pool event counters of one engine
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self, pool):
+        with self._lock:
+            stats = {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "soft_invalidations": self.soft_invalidations,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+            }
+        stats["pool"] = type(pool).__name__
+        # current state, only queue pools have a size and overflow
+        # (the pool counts overflow from -size, only connections opened beyond the size are reported)
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_out=pool.checkedout(),
+                         overflow=max(pool.overflow(), 0), idle=pool.checkedin())
+        return stats
+
+
+# queue pool that times how long each checkout waits for a connection
+# (an idle one from the pool, a new one, or a slot freed by another request)
+class TimedQueuePool(QueuePool):
+    metrics = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.count("timeouts")
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - started)
+
+    # engine.dispose() replaces the pool, keep counting into the same metrics
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+# metrics by bind key, None is the default database
+pool_metrics = {}
+
+
+# listen to the pool events of an engine, listeners on the engine carry over to recreated pools
+def instrument_engine(engine, bind_key=None):
+    metrics = pool_metrics[bind_key] = PoolMetrics()
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.metrics = metrics
+
+    event.listen(engine, "connect", lambda *args: metrics.count("connects"))
+    event.listen(engine, "checkout", lambda *args: metrics.count("checkouts"))
+    event.listen(engine, "checkin", lambda *args: metrics.count("checkins"))
+    event.listen(engine, "invalidate", lambda *args: metrics.count("invalidations"))
+    event.listen(engine, "soft_invalidate", lambda *args: metrics.count("soft_invalidations"))
+    return metrics
+
+
+# engines are flask-sqlalchemy's db.engines, keyed by bind key
+def pool_stats(engines):
+    return {bind_key or "default": pool_metrics[bind_key].snapshot(engine.pool)
+            for bind_key, engine in engines.items() if bind_key in pool_metrics}
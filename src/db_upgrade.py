@@ -0,0 +1,206 @@
+from sqlalchemy import inspect
+from sqlalchemy.schema import AddConstraint, CreateIndex, CreateTable
+from init import db
+from garden_versions import recount_gardens
+from search import TRIGRAM_EXTENSION
+
+
+# db.create_all() only creates missing tables, a database created before the models declared a column,
+# an index or a constraint does not get it, e.g. the ON DELETE CASCADE the deletes rely on (passive_deletes)
+# `flask db upgrade` adds them to the existing tables, rows are kept
+
+
+class UpgradeError(Exception):
+    pass
+
+
+# foreign keys of the table whose ON DELETE in the database is not the one of the model,
+# as (model constraint, reflected foreign key or None)
+def _changed_foreign_keys(inspector, table):
+    reflected = {(tuple(fk["constrained_columns"]), fk["referred_table"]): fk
+                 for fk in inspector.get_foreign_keys(table.name)}
+    changed = []
+    for constraint in table.foreign_key_constraints:
+        fk = reflected.get((tuple(constraint.column_keys), constraint.referred_table.name))
+        found = (fk or {}).get("options", {}).get("ondelete")
+        if (constraint.ondelete or "").upper() != (found or "").upper():
+            changed.append((constraint, fk))
+    return changed
+
+
+# unique constraints of the model without a unique constraint or unique index on the same columns
+def _missing_unique_constraints(inspector, table):
+    reflected = {frozenset(unique["column_names"]) for unique in inspector.get_unique_constraints(table.name)}
+    reflected |= {frozenset(index["column_names"]) for index in inspector.get_indexes(table.name) if index["unique"]}
+    return [constraint for constraint in table.constraints
+            if isinstance(constraint, db.UniqueConstraint) and frozenset(constraint.columns.keys()) not in reflected]
+
+
+# rows that would break a new unique constraint, as (values, count) of the first few duplicates
+def _duplicates(connection, constraint):
+    columns = list(constraint.columns)
+    stmt = db.select(*columns, db.func.count()).group_by(*columns).having(db.func.count() > 1).limit(3)
+    return [(tuple(row[:-1]), row[-1]) for row in connection.execute(stmt)]
+
+
+# indexes limited to one database with ddl_if (the postgres search indexes) are left out elsewhere
+def _applies(index, dialect):
+    condition = getattr(index, "_ddl_if", None)
+    return condition is None or condition.dialect in (None, dialect.name)
+
+
+# what is missing from the tables that exist, as (kind, item) pairs by table,
+# tables that do not exist yet are left to `flask db create`
+def _pending(connection):
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    pending = {}
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        changes = [("column", column) for column in table.columns if column.name not in columns]
+        changes += [("foreign key", change) for change in _changed_foreign_keys(inspector, table)]
+        changes += [("unique", constraint) for constraint in _missing_unique_constraints(inspector, table)]
+        changes += [("index", index) for index in table.indexes
+                    if index.name not in indexes and _applies(index, connection.dialect)]
+        if changes:
+            pending[table.name] = changes
+    return pending
+
+
+def _describe(kind, item):
+    if kind == "foreign key":
+        constraint, _ = item
+        return (f"foreign key ({', '.join(constraint.column_keys)}) -> {constraint.referred_table.name} "
+                f"ON DELETE {constraint.ondelete or 'NO ACTION'}")
+    if kind == "unique":
+        return f"unique ({', '.join(item.columns.keys())})"
+    return f"{kind} {item.name}"
+
+
+# the value a new column gets in the existing rows, its scalar default or NULL
+def _fill_value(column, dialect):
+    default = column.default
+    if default is not None and default.is_scalar:
+        return str(db.literal(default.arg).compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if not column.nullable:
+        raise UpgradeError(f"Column {column.table.name}.{column.name} is required and has no default")
+    return None
+
+
+# bring the tables up to the models, returns the changes made as descriptions by table
+def upgrade_db():
+    engine = db.engine
+    with engine.connect() as connection:
+        pending = _pending(connection)
+        # e.g. two plants placed on the same position before positions were unique, they are left to fix by hand
+        for name, changes in pending.items():
+            for constraint in (item for kind, item in changes if kind == "unique"):
+                duplicates = _duplicates(connection, constraint)
+                if duplicates:
+                    found = ", ".join(f"{values} {count} times" for values, count in duplicates)
+                    raise UpgradeError(f"{name} has duplicate ({', '.join(constraint.columns.keys())}): {found}")
+    if not pending:
+        return {}
+    if engine.dialect.name == "sqlite":
+        _upgrade_sqlite(engine, pending)
+    else:
+        _alter_tables(engine, pending)
+
+    # new garden counters start at 0, they are counted from the existing rows
+    if any(kind == "column" for kind, _ in pending.get("gardens", ())):
+        recount_gardens()
+        db.session.commit()
+    return {name: [_describe(kind, item) for kind, item in changes] for name, changes in pending.items()}
+
+
+# postgres: columns, constraints and indexes are changed in place, in one transaction
+def _alter_tables(engine, pending):
+    with engine.begin() as connection:
+        dialect = connection.dialect
+        quote = dialect.identifier_preparer.quote
+        if any(kind == "index" for changes in pending.values() for kind, _ in changes):
+            connection.execute(TRIGRAM_EXTENSION)
+        for name, changes in pending.items():
+            table = quote(name)
+            for kind, item in changes:
+                if kind == "column":
+                    value = _fill_value(item, dialect)
+                    definition = f"{quote(item.name)} {item.type.compile(dialect=dialect)}"
+                    if value is not None:
+                        definition += f" DEFAULT {value}"
+                    if not item.nullable:
+                        definition += " NOT NULL"
+                    connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {definition}")
+                    if value is not None:
+                        # the default only fills the existing rows, the models set it on insert
+                        connection.exec_driver_sql(f"ALTER TABLE {table} ALTER COLUMN {quote(item.name)} DROP DEFAULT")
+                elif kind == "foreign key":
+                    constraint, fk = item
+                    constraint_name = (fk or {}).get("name") or f"{name}_{constraint.column_keys[0]}_fkey"
+                    if fk is not None:
+                        connection.exec_driver_sql(f"ALTER TABLE {table} DROP CONSTRAINT {quote(fk['name'])}")
+                    columns = ", ".join(quote(column) for column in constraint.column_keys)
+                    referred = ", ".join(quote(element.column.name) for element in constraint.elements)
+                    on_delete = f" ON DELETE {constraint.ondelete}" if constraint.ondelete else ""
+                    connection.exec_driver_sql(
+                        f"ALTER TABLE {table} ADD CONSTRAINT {quote(constraint_name)} FOREIGN KEY ({columns}) "
+                        f"REFERENCES {quote(constraint.referred_table.name)} ({referred}){on_delete}")
+                elif kind == "unique":
+                    connection.execute(AddConstraint(item))
+                else:
+                    item.create(connection)
+
+
+# sqlite can not alter constraints, a table with new columns or constraints is created again from
+# the model and its rows copied, foreign keys are off meanwhile and checked before the commit
+def _upgrade_sqlite(engine, pending):
+    dialect = engine.dialect
+    quote = dialect.identifier_preparer.quote
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        existing_columns = {name: {column["name"] for column in inspector.get_columns(name)} for name in pending}
+
+    statements = ["BEGIN"]
+    for name, changes in pending.items():
+        table = db.metadata.tables[name]
+        if all(kind == "index" for kind, _ in changes):
+            statements.extend(str(CreateIndex(index).compile(dialect=dialect)) for _, index in changes)
+            continue
+        rebuilt = quote(f"_upgrade_{name}")
+        columns = ", ".join(quote(column.name) for column in table.columns)
+        values = ", ".join(quote(column.name) if column.name in existing_columns[name]
+                           else _fill_value(column, dialect) or "NULL" for column in table.columns)
+        create = str(CreateTable(table).compile(dialect=dialect)).strip()
+        statements.append(create.replace(f"CREATE TABLE {quote(name)} ", f"CREATE TABLE {rebuilt} ", 1))
+        statements.append(f"INSERT INTO {rebuilt} ({columns}) SELECT {values} FROM {quote(name)}")
+        statements.append(f"DROP TABLE {quote(name)}")
+        statements.append(f"ALTER TABLE {rebuilt} RENAME TO {quote(name)}")
+        statements.extend(str(CreateIndex(index).compile(dialect=dialect))
+                          for index in table.indexes if _applies(index, dialect))
+
+    pooled = engine.raw_connection()
+    raw = pooled.driver_connection
+    try:
+        # the pragma is ignored inside a transaction
+        raw.commit()
+        raw.execute("PRAGMA foreign_keys=OFF")
+        try:
+            raw.executescript(";\n".join(statements) + ";")
+            orphans = raw.execute("PRAGMA foreign_key_check").fetchall()
+            if orphans:
+                raise UpgradeError(f"{len(orphans)} rows reference missing rows, "
+                                   f"e.g. {orphans[0][0]} rowid {orphans[0][1]}")
+            raw.commit()
+        except engine.dialect.dbapi.IntegrityError as err:
+            raw.rollback()
+            raise UpgradeError(str(err))
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.execute("PRAGMA foreign_keys=ON")
+    finally:
+        pooled.close()
@@ -0,0 +1,112 @@
+import hashlib
+from flask import request
+from werkzeug.http import quote_etag
+from init import db
+from models.garden import Garden
+from models.garden_plant import GardenPlant
+from models.comment import Comment
+
+
+# every change to what a garden's responses show bumps Garden.version,
+# so polling clients can be answered from the version alone with 304 Not Modified
+
+# query parameters that change the body of a garden response, each combination has its own entity tag
+ETAG_ARGS = ("limit", "after", "fields", "include")
+
+# bump the version of the gardens matching the criteria, in the same transaction as the change
+# counters are the new values of the child counters, e.g. bump_garden_version(garden_id, **plants_added())
+def bump_garden_versions(*criteria, **counters):
+    stmt = db.update(Garden).where(*criteria).values(
+        version=Garden.version + 1, **counters).execution_options(synchronize_session=False)
+    db.session.execute(stmt)
+
+
+def bump_garden_version(garden_id, **counters):
+    bump_garden_versions(Garden.id == garden_id, **counters)
+
+
+def plants_added(count=1):
+    return {"plant_count": Garden.plant_count + count}
+
+
+def plant_removed():
+    return {"plant_count": Garden.plant_count - 1}
+
+
+# the latest comment date only moves forward when a comment is added
+def _latest(comment_date):
+    return db.case((Garden.last_comment_date > comment_date, Garden.last_comment_date), else_=comment_date)
+
+
+def comments_added(comment_date, count=1):
+    return {"comment_count": Garden.comment_count + count, "last_comment_date": _latest(comment_date)}
+
+
+# counters counted again from the child rows, for changes that can not be applied as a difference
+# (a removed comment may have been the latest one, cascade deletes remove an unknown number of rows)
+# criteria leave out rows that are deleted in the same transaction
+def recounted_plants(*criteria):
+    count = db.select(db.func.count(GardenPlant.id)).where(
+        GardenPlant.garden_id == Garden.id, *criteria).scalar_subquery()
+    return {"plant_count": count}
+
+
+def recounted_comments(*criteria):
+    criteria = (Comment.garden_id == Garden.id, *criteria)
+    return {
+        "comment_count": db.select(db.func.count(Comment.id)).where(*criteria).scalar_subquery(),
+        "last_comment_date": db.select(db.func.max(Comment.comment_date)).where(*criteria).scalar_subquery(),
+    }
+
+
+def recount_gardens(*criteria):
+    bump_garden_versions(*criteria, **recounted_plants(), **recounted_comments())
+
+
+# comments written in one batch, counts is {garden id: number of new comments}
+# one executemany UPDATE, as every garden gets a different count
+def bump_garden_comment_counts(counts, comment_date):
+    stmt = db.update(Garden.__table__).where(Garden.id == db.bindparam("garden")).values(
+        version=Garden.version + 1, comment_count=Garden.comment_count + db.bindparam("added"),
+        last_comment_date=_latest(comment_date))
+    db.session.connection().execute(
+        stmt, [{"garden": garden_id, "added": added} for garden_id, added in counts.items()])
+
+
+# gardens showing the user, as owner or as commenter
+def gardens_of_user(user_id):
+    commented = db.select(Comment.garden_id).where(Comment.user_id == user_id)
+    return db.or_(Garden.user_id == user_id, Garden.id.in_(commented))
+
+
+# gardens showing the plant in their garden_plants
+def gardens_with_plant(plant_id):
+    return Garden.id.in_(db.select(GardenPlant.garden_id).where(GardenPlant.plant_id == plant_id))
+
+
+# entity tag of a garden from a single primary key lookup, None if the garden does not exist
+def garden_etag(garden_id):
+    version = db.session.scalar(
+        db.select(Garden.version).filter_by(id=garden_id))
+    if version is None:
+        return None
+    return version_etag(garden_id, version)
+
+
+# the tag of the garden version, with a hash of the ETAG_ARGS of the request when there are any
+# (e.g. page 2 must not be answered with 304 for the tag of page 1)
+def version_etag(garden_id, version):
+    etag = f"garden-{garden_id}-{version}"
+    variant = [(name, request.args.getlist(name)) for name in ETAG_ARGS if name in request.args]
+    if variant:
+        etag += "-" + hashlib.sha1(repr(variant).encode("utf-8")).hexdigest()[:16]
+    return etag
+
+
+def etag_header(etag):
+    return {"ETag": quote_etag(etag)}
+
+
+# True when the client already has this version (If-None-Match)
+def is_not_modified(etag):
+    return request.if_none_match.contains(etag)
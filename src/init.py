@@ -2,8 +2,12 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
+from cache import Cache
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+# the session class sends the reads of GET requests to a read replica when replicas are configured
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 ma = Marshmallow()
 bcrypt = Bcrypt()
-jwt = JWTManager()
\ No newline at end of file
+jwt = JWTManager()
+cache = Cache()
\ No newline at end of file
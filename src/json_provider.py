@@ -0,0 +1,46 @@
+from flask.json.provider import JSONProvider, DefaultJSONProvider, _default
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON provider backed by orjson, it encodes dates natively and writes the response bytes directly
+# enabled with JSON_PROVIDER=orjson, needs the orjson package
+class OrjsonProvider(JSONProvider):
+    sort_keys = True
+    compact = None
+    mimetype = "application/json"
+
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    # stdlib only keyword arguments (separators, indent, ...) are ignored, orjson output is always compact
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self._options()).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=_default,
+                            option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+# provider named by JSON_PROVIDER, falls back to flask's stdlib provider when orjson is not installed
+def json_provider(app, name):
+    if name == "orjson":
+        if orjson is not None:
+            return OrjsonProvider(app)
+        app.logger.warning(
+            "JSON_PROVIDER is 'orjson' but orjson is not installed, using the default JSON provider")
+    return DefaultJSONProvider(app)
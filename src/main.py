@@ -1,23 +1,72 @@
 from flask import Flask
 import os
-from init import db, ma, bcrypt, jwt
+from init import db, ma, bcrypt, jwt, cache
 from controllers.cli_controller import db_commands
+from controllers.bench_controller import bench_commands
 from controllers.auth_controller import auth_bp
 from controllers.garden_controller import garden_bp
 from controllers.plant_controller import plant_bp
 from marshmallow.exceptions import ValidationError
+from sqlalchemy import event
 from sqlalchemy.exc import IntegrityError
+from token_versions import is_token_revoked
+from password_hashing import HashingBusy
+from json_provider import json_provider
+from comment_ingestion import comment_ingestor, IngestionBusy
+from db_pool import engine_options, instrument_engine, pool_stats
+from profiling import request_profiler
+from controllers.profile_controller import profile_commands
+from async_db import async_db
+from replicas import replica_binds, replica_router
+from row_reads import ROW_READ_ROUTES
 
 
 def create_app():
     # Creating the flask app object
     app = Flask(__name__)
 
+    # JSON_PROVIDER=orjson serializes responses with orjson when it is installed
+    app.json = json_provider(app, os.environ.get("JSON_PROVIDER", "default"))
     app.json.sort_keys = False
     # configuration key for SQLAlchemy, used to define the URI (Uniform Resource Identifier) for connecting to the database.
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
+    # connection pool size, overflow, timeout, recycle and pre ping, from DB_POOL_* variables
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    # DATABASE_REPLICA_URLS, comma separated read replicas, GET requests read from one of them
+    replica_urls = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    app.config["SQLALCHEMY_BINDS"] = replica_binds(replica_urls)
+    # seconds a replica may lag behind before its reads go to the primary, and seconds between lag checks
+    app.config["REPLICA_MAX_LAG"] = float(os.environ.get("REPLICA_MAX_LAG", 10))
+    app.config["REPLICA_LAG_CHECK_INTERVAL"] = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 5))
+    # endpoints that read flat responses as Core rows instead of ORM objects, ROW_READS= (empty) turns it off
+    app.config["ROW_READS"] = [name.strip() for name in os.environ.get(
+        "ROW_READS", ",".join(ROW_READ_ROUTES)).split(",") if name.strip()]
+    # database of the async read routes (asgi.py), defaults to DATABASE_URL with its async driver
+    app.config["ASYNC_DATABASE_URI"] = os.environ.get("ASYNC_DATABASE_URL")
     # configuration key for the JWT, etrieves the value of the environment variable named "JWT_SECRET_KEY", used to sign and verify the JWT, 
     app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY")
+    # bcrypt cost, stored hashes with a different cost are rehashed on login
+    app.config["BCRYPT_LOG_ROUNDS"] = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+    # password hashing pool size and how many requests may wait for it before answering 503
+    app.config["HASH_WORKERS"] = int(os.environ.get("HASH_WORKERS", 2))
+    app.config["HASH_QUEUE_LIMIT"] = int(os.environ.get("HASH_QUEUE_LIMIT", 16))
+    # plant catalogue cache, in-process by default, shared between workers when a redis url is set
+    app.config["CACHE_REDIS_URL"] = os.environ.get("CACHE_REDIS_URL")
+    app.config["CACHE_TTL"] = int(os.environ.get("CACHE_TTL", 300))
+    # seconds the in-memory search index is kept when the database is not postgres
+    app.config["SEARCH_INDEX_TTL"] = int(os.environ.get("SEARCH_INDEX_TTL", 60))
+    # COMMENT_INGESTION=batched queues new comments and writes them in batches
+    app.config["COMMENT_INGESTION"] = os.environ.get("COMMENT_INGESTION", "direct")
+    app.config["COMMENT_BATCH_SIZE"] = int(os.environ.get("COMMENT_BATCH_SIZE", 200))
+    app.config["COMMENT_FLUSH_INTERVAL"] = float(os.environ.get("COMMENT_FLUSH_INTERVAL", 0.5))
+    app.config["COMMENT_QUEUE_LIMIT"] = int(os.environ.get("COMMENT_QUEUE_LIMIT", 10000))
+    app.config["COMMENT_WRITE_RETRIES"] = int(os.environ.get("COMMENT_WRITE_RETRIES", 5))
+    # PROFILING=true records latency, queries and dump time per endpoint, see /metrics/requests
+    app.config["PROFILING"] = os.environ.get("PROFILING", "false").lower() in ("1", "true", "yes")
+    # requests running one statement more than this many times are flagged as N+1
+    app.config["PROFILING_N_PLUS_ONE"] = int(os.environ.get("PROFILING_N_PLUS_ONE", 10))
+    # fraction of requests captured with cProfile
+    app.config["PROFILING_SAMPLE_RATE"] = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
 
     # Error handlers
     @app.errorhandler(ValidationError)
@@ -32,6 +81,23 @@ def create_app():
     def invalid_token_callback(err):
         return {"error": "Invalid or missing JWT"}, 401
 
+    # reject tokens signed with an old token version (admin status changed or user deleted)
+    @jwt.token_in_blocklist_loader
+    def token_revoked_check(jwt_header, jwt_payload):
+        return is_token_revoked(jwt_payload)
+
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_payload):
+        return {"error": "Token has been revoked, please login again"}, 401
+
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(err):
+        return {"error": "Too many login requests, please try again shortly"}, 503, {"Retry-After": "1"}
+
+    @app.errorhandler(IngestionBusy)
+    def ingestion_busy(err):
+        return {"error": "Too many comments, please try again shortly"}, 503, {"Retry-After": "1"}
+
     @app.errorhandler(400)
     def bad_request(err):
         return {'error': str(err)}, 400
@@ -42,16 +108,56 @@ def create_app():
 
     # create database, marshmallow, bcrypt, jwt objects
     db.init_app(app)
+    request_profiler.init_app(app)
+    replica_router.init_app(app)
+    # sqlite only enforces foreign keys, and their ON DELETE CASCADE, when it is turned on per connection
+    with app.app_context():
+        # the primary and every replica, by bind key
+        for bind_key, engine in db.engines.items():
+            instrument_engine(engine, bind_key)
+            request_profiler.instrument_engine(engine)
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect",
+                             lambda dbapi_connection, record: dbapi_connection.execute("PRAGMA foreign_keys=ON"))
     ma.init_app(app)
     bcrypt.init_app(app)
     jwt.init_app(app)
+    cache.init_app(app)
+    comment_ingestor.init_app(app)
 
     # Registering blueprints
     app.register_blueprint(db_commands)
+    app.register_blueprint(bench_commands)
+    app.register_blueprint(profile_commands)
     app.register_blueprint(auth_bp)
     app.register_blueprint(garden_bp)
     app.register_blueprint(plant_bp)
 
+    # batched comment ingestion queue and flush statistics
+    @app.get('/metrics/comments')
+    def comment_ingestion_metrics():
+        return comment_ingestor.metrics()
+
+    # connection pool checkouts, overflow, wait time and invalidations per database
+    @app.get('/metrics/pool')
+    def pool_metrics():
+        return pool_stats({**db.engines, **async_db.engines})
+
+    # replica lag, availability and reads, and the reads that went back to the primary
+    @app.get('/metrics/replicas')
+    def replica_metrics():
+        return replica_router.metrics()
+
+    # per endpoint latency, queries and dump time, and the requests flagged as N+1, when PROFILING is on
+    @app.get('/metrics/requests')
+    def request_metrics():
+        return request_profiler.metrics()
+
+    # the sampled cProfile captures
+    @app.get('/metrics/requests/profiles')
+    def request_profiles():
+        return request_profiler.sampled_profiles()
+
     # Welcome route
 
     @app.get('/')
@@ -3,15 +3,22 @@ from init import db
 
 class Comment(db.Model):
     __tablename__ = "comments"
+    # matches the comment listing of a garden: filter by garden, newest first, id breaks ties
+    __table_args__ = (
+        db.Index("ix_comments_garden_id_comment_date",
+                 "garden_id", db.desc("comment_date"), db.desc("id")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     message = db.Column(db.Text, nullable=False)
     comment_date = db.Column(db.Date)
 
     # relates to user and garden table
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # deleted by the database with their user or garden
+    user_id = db.Column(db.Integer, db.ForeignKey(
+        'users.id', ondelete="CASCADE"), nullable=False, index=True)
     garden_id = db.Column(db.Integer, db.ForeignKey(
-        'gardens.id'), nullable=False)
+        'gardens.id', ondelete="CASCADE"), nullable=False)
 
     # provide the sqlalchemy relationship instead of database
     # refers to User model comment field
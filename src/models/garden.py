@@ -8,17 +8,27 @@ class Garden(db.Model):
     garden_name = db.Column(db.String(200), nullable=False, unique=True)
     creation_date = db.Column(db.Date)
     description = db.Column(db.Text)
+    # bumped by every change shown in the garden's responses, used as the ETag of the garden
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # counters of the garden's children for ?view=summary, kept up to date by the garden_plant and comment
+    # write paths in the same statement as the version, so listing gardens does not read the child tables
+    plant_count = db.Column(db.Integer, nullable=False, default=0)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    last_comment_date = db.Column(db.Date)
 
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # indexed for the user's gardens and the cascade delete from User.gardens
+    user_id = db.Column(db.Integer, db.ForeignKey(
+        'users.id', ondelete="CASCADE"), nullable=False, index=True)
 
     # refer to User model -gardens field
     user = db.relationship("User", back_populates="gardens")
 
     # refer to GardenPlant model -garden field, when garden is deleted, delete all garden_plants related to that garden
+    # passive_deletes leaves unloaded garden_plants to the database ON DELETE CASCADE instead of loading them
     garden_plants = db.relationship(
         "GardenPlant",
-        back_populates="garden", cascade="all, delete")
+        back_populates="garden", cascade="all, delete", passive_deletes=True)
 
     # refer to comment model -garden field, when garden is deleted, delete all comments related to that garden
     comments = db.relationship(
-        "Comment", back_populates="garden", cascade="all, delete")
+        "Comment", back_populates="garden", cascade="all, delete", passive_deletes=True)
@@ -3,16 +3,22 @@ from init import db
 
 class GardenPlant(db.Model):
     __tablename__ = "garden_plants"
+    # one plant per position in a garden, also serves lookups of a garden's plants
+    __table_args__ = (
+        db.UniqueConstraint("garden_id", "position",
+                            name="uq_garden_plants_garden_id_position"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     color = db.Column(db.String(), default="Green")
     position = db.Column(db.String(), nullable=False)
     size = db.Column(db.String(), default="Medium")
 
+    # deleted by the database with their garden or plant
     garden_id = db.Column(db.Integer, db.ForeignKey(
-        "gardens.id"), nullable=False)
+        "gardens.id", ondelete="CASCADE"), nullable=False)
     plant_id = db.Column(db.Integer, db.ForeignKey(
-        "plants.id"), nullable=False)
+        "plants.id", ondelete="CASCADE"), nullable=False, index=True)
 
     # extra attributes, garden and plant refers to Garden and Plant model
     garden = db.relationship(
@@ -11,7 +11,8 @@ class Plant(db.Model):
     growth_rate = db.Column(db.String, default="High")
 
     # add relationship to GardenPlant model, when plant is deleted, all garden_plants will be deleted
+    # by the database ON DELETE CASCADE, without loading them
     garden_plants = db.relationship(
         "GardenPlant",
-        back_populates="plant", cascade="all, delete"
+        back_populates="plant", cascade="all, delete", passive_deletes=True
     )
@@ -10,11 +10,14 @@ class User(db.Model):
     password = db.Column(db.String(), nullable=False)
     # set default admin value to false
     is_admin = db.Column(db.Boolean, default=False)
+    # bumped to revoke all issued tokens, e.g. when the admin status changes
+    token_version = db.Column(db.Integer, nullable=False, default=0)
 
     # add relationship to garden，refers to Garden model -user field, when user is deleted, all gardens will be deleted
+    # the deletes are done by the database ON DELETE CASCADE (passive_deletes), the children are not loaded
     gardens = db.relationship(
-        "Garden", back_populates="user", cascade="all, delete")
+        "Garden", back_populates="user", cascade="all, delete", passive_deletes=True)
 
     # add relationship to comment, when user is deleted, all comments will be deleted
     comments = db.relationship(
-        "Comment", back_populates="user", cascade="all, delete")
+        "Comment", back_populates="user", cascade="all, delete", passive_deletes=True)
@@ -0,0 +1,106 @@
+import base64
+import json
+from datetime import date
+from flask import request, abort, current_app
+from sqlalchemy import orm
+from init import db
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+# read ?limit= and ?after= from the query string, limit falls back to the configured page size
+# and anything but a number in range is a 400
+def page_args():
+    default_limit = current_app.config.get("DEFAULT_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+    max_limit = current_app.config.get("MAX_PAGE_SIZE", MAX_PAGE_SIZE)
+
+    # parsed here rather than with type=int, which silently falls back to the default on e.g. ?limit=abc
+    try:
+        limit = int(request.args.get("limit", default_limit))
+    except ValueError:
+        limit = None
+    if limit is None or limit < 1 or limit > max_limit:
+        abort(400, description=f"'limit' must be a number between 1 and {max_limit}")
+
+    return limit, request.args.get("after")
+
+
+# the cursor is the ordering values of the last row on the page, encoded so clients treat it as opaque
+def encode_cursor(row, keys):
+    values = [getattr(row, key.key) for key in keys]
+    values = [value.isoformat() if isinstance(value, date) else value
+              for value in values]
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, keys):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(cursor)
+        # convert date values back, so the comparison uses the column type
+        return [date.fromisoformat(value) if key.type.python_type is date else value
+                for key, value in zip(keys, values)]
+    except (ValueError, TypeError):
+        abort(400, description=f"Invalid cursor '{cursor}'")
+
+
+# keyset pagination, seek past the cursor on the ordering columns instead of using OFFSET
+# so every page costs the same no matter how deep it is
+# keys are the ordering columns, the last one must be unique (e.g. the primary key) to break ties
+# rows=True for a select of columns, the page is a list of Core rows instead of model instances
+def paginate(stmt, *keys, descending=False, rows=False):
+    limit, stmt = _page_statement(stmt, keys, descending)
+    if rows:
+        return _page(db.session.execute(stmt).all(), keys, limit)
+    rows = db.session.scalars(_undefer(stmt, keys)).all()
+    return _page(rows, keys, limit)
+
+
+# paginate with an AsyncSession, for the async read routes
+async def paginate_async(session, stmt, *keys, descending=False):
+    limit, stmt = _page_statement(stmt, keys, descending)
+    rows = (await session.scalars(_undefer(stmt, keys))).all()
+    return _page(rows, keys, limit)
+
+
+def _page_statement(stmt, keys, descending):
+    limit, after = page_args()
+
+    if after:
+        values = decode_cursor(after, keys)
+        if len(keys) == 1:
+            column, value = keys[0], values[0]
+            seek = column < value if descending else column > value
+        else:
+            row_keys = db.tuple_(*keys)
+            seek = row_keys < db.tuple_(*values) if descending else row_keys > db.tuple_(*values)
+        stmt = stmt.where(seek)
+
+    order = [key.desc() for key in keys] if descending else list(keys)
+    # fetch one extra row to know if there is a next page
+    return limit, stmt.order_by(*order).limit(limit + 1)
+
+
+# the cursor is read from the last row, load the ordering columns even when the query loads only some columns
+def _undefer(stmt, keys):
+    return stmt.options(*[orm.undefer(key) for key in keys])
+
+
+def _page(rows, keys, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], keys)
+    return rows, next_cursor
+
+
+# response headers pointing to the next page, empty on the last page
+def page_headers(next_cursor):
+    if next_cursor:
+        return {"X-Next-Cursor": next_cursor}
+    return {}
@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from init import bcrypt
+
+
+HASH_WORKERS = 2
+HASH_QUEUE_LIMIT = 16
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+# raised when the hashing pool is full, answered with 503 instead of queueing the request
+class HashingBusy(Exception):
+    pass
+
+
+# bcrypt runs on a small bounded pool instead of every request thread,
+# so a burst of logins can only use HASH_WORKERS cores and the other routes keep being served
+def _pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = current_app.config.get("HASH_WORKERS", HASH_WORKERS)
+            queue_limit = current_app.config.get("HASH_QUEUE_LIMIT", HASH_QUEUE_LIMIT)
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="bcrypt")
+            _slots = threading.BoundedSemaphore(workers + queue_limit)
+    return _executor, _slots
+
+
+def _run(fn, *args):
+    executor, slots = _pool()
+    # reject right away once HASH_QUEUE_LIMIT requests are already waiting
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        return executor.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    return _run(bcrypt.generate_password_hash, password).decode("utf-8")
+
+
+def check_password(pw_hash, password):
+    return _run(bcrypt.check_password_hash, pw_hash, password)
+
+
+# bcrypt hashes look like $2b$12$..., the number is the cost they were created with
+def needs_rehash(pw_hash):
+    try:
+        rounds = int(pw_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return True
+    return rounds != current_app.config.get("BCRYPT_LOG_ROUNDS", 12)
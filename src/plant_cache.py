@@ -0,0 +1,54 @@
+import uuid
+from flask import current_app
+from init import db, cache
+from models.garden_plant import GardenPlant
+
+
+# serialized plant payloads, so cache hits skip both the query and the schema dump
+# catalogue pages are keyed by a catalogue version, any plant write moves to a new version
+# so every cached page is dropped at once without having to know their keys
+CATALOGUE_VERSION_KEY = "plants:version"
+
+
+def catalogue_version():
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        version = invalidate_catalogue()
+    return version
+
+
+# projection is the ?fields= of the request, each field set is cached apart
+def catalogue_key(limit, after, projection=""):
+    return f"plants:{catalogue_version()}:{limit}:{after or ''}:{projection}"
+
+
+def plant_key(plant_id):
+    return f"plant:{plant_id}"
+
+
+# response body as text, the same as the route would send
+def to_json(data):
+    return current_app.json.dumps(data, separators=(",", ":"))
+
+
+def json_response(body, headers=None):
+    return current_app.response_class(body, mimetype="application/json", headers=headers)
+
+
+def invalidate_catalogue():
+    version = uuid.uuid4().hex
+    cache.set(CATALOGUE_VERSION_KEY, version, ttl=0)
+    return version
+
+
+# plant payloads embed their garden_plants with garden and user names,
+# so writes to those drop the payloads of the plants involved
+def invalidate_plants(*plant_ids):
+    cache.delete(*(plant_key(plant_id) for plant_id in set(plant_ids)))
+
+
+# ids of the plants placed in the gardens matching the criteria, e.g. Garden.user_id == user_id
+def plant_ids_in_gardens(*criteria):
+    stmt = db.select(GardenPlant.plant_id).join(
+        GardenPlant.garden).where(*criteria).distinct()
+    return db.session.scalars(stmt).all()
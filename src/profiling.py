@@ -0,0 +1,216 @@
+import bisect
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+from collections import Counter, deque
+from flask import g, request, has_request_context
+from sqlalchemy import event
+import schema_compiler
+
+
+# upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+
+# numbers of one request, kept on g while the request runs
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = Counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.dump_time = 0.0
+        self.dump_depth = 0
+        self.profile = None
+
+
+# totals of one endpoint
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.sql_count = 0
+        self.max_sql_count = 0
+        self.sql_ms = 0.0
+        self.dump_ms = 0.0
+        self.n_plus_one = 0
+
+    def add(self, elapsed_ms, status, stats, n_plus_one):
+        self.requests += 1
+        self.errors += status >= 500
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed_ms)] += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.sql_count += stats.sql_count
+        self.max_sql_count = max(self.max_sql_count, stats.sql_count)
+        self.sql_ms += stats.sql_time * 1000
+        self.dump_ms += stats.dump_time * 1000
+        self.n_plus_one += bool(n_plus_one)
+
+    # percentiles are read from the histogram, as the upper bound of the bucket they fall in
+    def percentile(self, fraction):
+        rank = fraction * self.requests
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound if bound != float("inf") else round(self.max_ms, 2)
+        return 0
+
+    def summary(self):
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ms": {
+                "avg": round(self.total_ms / requests, 2),
+                "p50": self.percentile(0.5),
+                "p95": self.percentile(0.95),
+                "p99": self.percentile(0.99),
+                "max": round(self.max_ms, 2),
+                "histogram": {f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS, self.buckets)},
+            },
+            "queries_per_request": round(self.sql_count / requests, 2),
+            "max_queries": self.max_sql_count,
+            "sql_ms_per_request": round(self.sql_ms / requests, 2),
+            "dump_ms_per_request": round(self.dump_ms / requests, 2),
+            "n_plus_one_requests": self.n_plus_one,
+        }
+
+
+# opt-in request profiler, enabled with PROFILING=true
+# records per endpoint latency, SQL statement count and time, schema dump time,
+# flags requests that run the same statement more than PROFILING_N_PLUS_ONE times
+# and captures a cProfile of PROFILING_SAMPLE_RATE of the requests
+class RequestProfiler:
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.profiles = deque(maxlen=20)
+        self.n_plus_one_flags = deque(maxlen=20)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get("PROFILING", False)
+        if not self.enabled:
+            schema_compiler.dump_timer = None
+            return
+        self.n_plus_one_threshold = app.config.get("PROFILING_N_PLUS_ONE", 10)
+        self.sample_rate = app.config.get("PROFILING_SAMPLE_RATE", 0.0)
+        kept = app.config.get("PROFILING_PROFILES_KEPT", 20)
+        self.profiles = deque(maxlen=kept)
+        self.n_plus_one_flags = deque(maxlen=kept)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        schema_compiler.dump_timer = self.time_dump
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+            self.profiles.clear()
+            self.n_plus_one_flags.clear()
+
+    # sql events of an engine, statements run outside of a request (cli, comment ingestion) are not counted
+    def instrument_engine(self, engine):
+        if not self.enabled:
+            return
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _current(self):
+        if has_request_context():
+            return g.get("request_stats")
+        return None
+
+    def _before_request(self):
+        stats = g.request_stats = RequestStats()
+        if self.sample_rate and random.random() < self.sample_rate:
+            stats.profile = cProfile.Profile()
+            try:
+                stats.profile.enable()
+            except ValueError:
+                # another profiler is already running in this thread
+                stats.profile = None
+
+    def _after_request(self, response):
+        stats = self._current()
+        if stats is None:
+            return response
+        if stats.profile is not None:
+            stats.profile.disable()
+        elapsed_ms = (time.perf_counter() - stats.started) * 1000
+        endpoint = request.endpoint or "<unmatched>"
+
+        repeated = [(statement, count) for statement, count in stats.statements.most_common(3)
+                    if count > self.n_plus_one_threshold]
+        if repeated:
+            self.app.logger.warning("Possible N+1 on %s %s: %s runs %s times",
+                                    request.method, request.path, repeated[0][0], repeated[0][1])
+
+        with self._lock:
+            self.endpoints.setdefault(endpoint, EndpointStats()).add(
+                elapsed_ms, response.status_code, stats, repeated)
+            for statement, count in repeated:
+                self.n_plus_one_flags.append({"endpoint": endpoint, "path": request.path,
+                                              "statement": statement, "repeats": count})
+            if stats.profile is not None:
+                self.profiles.append({"endpoint": endpoint, "path": request.path,
+                                      "elapsed_ms": round(elapsed_ms, 2),
+                                      "profile": _profile_text(stats.profile)})
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current() is not None:
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._current()
+        if stats is None or not conn.info.get("query_started"):
+            return
+        stats.sql_time += time.perf_counter() - conn.info["query_started"].pop()
+        stats.sql_count += 1
+        # the statement text has placeholders for the parameters,
+        # so the same query with different values has the same shape
+        stats.statements[statement] += 1
+
+    # time top level schema dumps, nested schemas are part of their parent's dump
+    def time_dump(self, dump, obj, many):
+        stats = self._current()
+        if stats is None or stats.dump_depth:
+            return dump(obj, many=many)
+        stats.dump_depth += 1
+        started = time.perf_counter()
+        try:
+            return dump(obj, many=many)
+        finally:
+            stats.dump_time += time.perf_counter() - started
+            stats.dump_depth -= 1
+
+    def metrics(self):
+        with self._lock:
+            endpoints = {name: stats.summary() for name, stats in sorted(self.endpoints.items())}
+            flags = list(self.n_plus_one_flags)
+        return {"enabled": self.enabled, "endpoints": endpoints, "n_plus_one": flags}
+
+    def sampled_profiles(self):
+        with self._lock:
+            return {"enabled": self.enabled, "profiles": list(self.profiles)}
+
+
+# the 25 functions with the highest cumulative time
+def _profile_text(profile):
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(25)
+    return output.getvalue()
+
+
+request_profiler = RequestProfiler()
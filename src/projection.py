@@ -0,0 +1,86 @@
+import functools
+from flask import request, abort
+from query_options import nested_schema
+
+
+# a comma separated query parameter, None when it is not given
+def _names(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+# the route's schema narrowed to the requested fields, or the schema itself when the request does not ask
+# ?fields=id,garden_name,comments.message picks the fields to dump, dotted names pick fields of nested schemas
+# ?include=comments,garden_plants.plant picks the relationships to embed, relationships that are not listed are left out
+# both are checked against the fields the route's schema dumps, so excluded fields (e.g. password) can not be asked for
+def project(schema):
+    fields = _names("fields")
+    include = _names("include")
+    if fields is None and include is None:
+        return schema
+    if fields == []:
+        abort(400, description="'fields' must name at least one field")
+    # in the schema's field order, so ordered schemas keep their key order,
+    # the same field set always gives the same tuple, so it is also the cache key
+    only = _select(schema, fields, include, "")
+    return _projected_schema(schema, tuple(only))
+
+
+# part of the cache key of a response, empty when the request does not narrow the schema
+def projection_key():
+    return f"{request.args.get('fields', '')}|{request.args.get('include', '')}".strip("|")
+
+
+# one schema instance per route schema and field set, so the compiled serializer
+# and the loader options are built once for it
+@functools.lru_cache(maxsize=256)
+def _projected_schema(schema, only):
+    projected = type(schema)(only=only, exclude=schema.exclude, many=schema.many)
+    # tells schema_load_options to load only the dumped columns
+    projected.projected = True
+    return projected
+
+
+def _children(names, parent):
+    prefix = parent + "."
+    return [name[len(prefix):] for name in names if name.startswith(prefix)]
+
+
+# field names for the schema's only= (dotted for nested schemas) in the schema's field order,
+# path is the prefix used in error messages
+def _select(schema, fields, include, path):
+    available = schema.fields
+    relationships = {name for name, field in available.items() if nested_schema(field) is not None}
+    top_fields = None if fields is None else {name.split(".", 1)[0] for name in fields}
+    top_include = None if include is None else {name.split(".", 1)[0] for name in include}
+
+    for name in (top_fields or set()) | (top_include or set()):
+        if name not in available:
+            abort(400, description=f"Unknown field '{path}{name}', expected one of: {', '.join(available)}")
+    for name in top_include or ():
+        if name in relationships:
+            continue
+        if not relationships:
+            owner = f"'{path[:-1]}'" if path else "this resource"
+            abort(400, description=f"'{path}{name}' is not a relationship, {owner} has no relationships")
+        abort(400, description=f"'{path}{name}' is not a relationship, expected one of: {', '.join(sorted(relationships))}")
+
+    names = set(available) if top_fields is None else top_fields
+    if top_include is not None:
+        names = (names - relationships) | top_include
+
+    selected = []
+    for name in available:
+        if name not in names:
+            continue
+        selected.append(name)
+        if name not in relationships:
+            continue
+        child_fields = _children(fields, name) if fields else []
+        child_include = _children(include, name) if include is not None else None
+        if child_fields or child_include is not None:
+            child = _select(nested_schema(available[name]), child_fields or None, child_include, f"{path}{name}.")
+            selected.extend(f"{name}.{child_name}" for child_name in child)
+    return selected
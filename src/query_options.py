@@ -0,0 +1,70 @@
+from marshmallow import fields
+from sqlalchemy import orm
+
+
+# max depth of nested relationships to follow when building loader options
+MAX_LOAD_DEPTH = 4
+
+
+# return the nested schema instance of a field, if the field dumps a relationship
+def nested_schema(field):
+    if isinstance(field, fields.List):
+        field = field.inner
+    if isinstance(field, fields.Nested):
+        return field.schema
+    return None
+
+
+# build relationship loading options from the fields a schema will dump
+# one-to-many relationships use selectinload (one extra IN query per relationship),
+# many-to-one relationships use joinedload (joined into the parent query)
+# so dumping any number of rows costs a fixed number of queries
+# schemas narrowed by ?fields= (see projection) also load only the columns they dump
+# the options are kept on the schema instance, so projected schemas take them along when they are dropped
+def schema_load_options(model, schema):
+    cached = schema.__dict__.setdefault("_load_options", {})
+    options = cached.get(model)
+    if options is None:
+        options = cached[model] = tuple(_load_options(model, schema, 0, getattr(schema, "projected", False)))
+    return options
+
+
+def _load_options(model, schema, depth, columns):
+    options = []
+    if columns:
+        options.append(orm.load_only(*_dumped_columns(model, schema)))
+    if depth >= MAX_LOAD_DEPTH:
+        return options
+
+    for name, field in schema.fields.items():
+        nested = nested_schema(field)
+        attr = getattr(model, name, None)
+        if nested is None or attr is None:
+            continue
+
+        # only follow ORM relationships, skip plain columns and properties
+        relationship = getattr(attr, "property", None)
+        if not isinstance(relationship, orm.RelationshipProperty):
+            continue
+
+        strategy = "selectinload" if relationship.uselist else "joinedload"
+        loader = getattr(orm, strategy)(attr)
+
+        # options of the related model apply below this relationship
+        children = _load_options(
+            relationship.mapper.class_, nested, depth + 1, columns)
+        options.append(loader.options(*children) if children else loader)
+
+    return options
+
+
+# the primary key and the columns a schema dumps
+def _dumped_columns(model, schema):
+    mapper = orm.class_mapper(model)
+    columns = [getattr(model, mapper.get_property_by_column(column).key)
+               for column in mapper.primary_key]
+    for name, field in schema.fields.items():
+        prop = mapper.attrs.get(field.attribute or name)
+        if isinstance(prop, orm.ColumnProperty) and prop.key not in {column.key for column in columns}:
+            columns.append(getattr(model, prop.key))
+    return columns
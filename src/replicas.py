@@ -0,0 +1,177 @@
+import itertools
+import threading
+import time
+from collections import Counter
+from flask import request, current_app, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc, text
+from db_pool import engine_options
+
+
+# read replicas are flask-sqlalchemy binds named replica_<n>, no model is bound to them
+REPLICA_BIND_PREFIX = "replica_"
+# seconds a replica may be behind the primary before reads go back to the primary
+REPLICA_MAX_LAG = 10
+# seconds between two lag checks of a replica, the result is shared by the requests of this worker
+REPLICA_LAG_CHECK_INTERVAL = 5
+
+# replication lag in seconds, 0 when the replica replayed everything it received
+# databases without a query here (e.g. sqlite files) are only checked for being reachable
+LAG_QUERIES = {
+    "postgresql": "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                  "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END",
+}
+
+
+# SQLALCHEMY_BINDS of the replica urls, with the same pool settings as the primary
+def replica_binds(urls):
+    return {f"{REPLICA_BIND_PREFIX}{index}": {"url": url, **engine_options(url)}
+            for index, url in enumerate(urls)}
+
+
+def replica_lag(engine):
+    query = LAG_QUERIES.get(engine.dialect.name, "SELECT 0")
+    with engine.connect() as connection:
+        return float(connection.execute(text(query)).scalar() or 0)
+
+
+# mark a view that only reads, so it goes to a replica like the GET routes
+def read_only(fn):
+    fn.read_only = True
+    return fn
+
+
+# the rest of the request reads the primary, e.g. before filling a shared cache,
+# a lagging replica would otherwise keep the cache stale for its whole TTL
+def use_primary(session):
+    session.info["primary"] = True
+
+
+# GET routes and views marked read_only, CLI commands and background threads always use the primary
+def is_read_only_request():
+    if not has_request_context():
+        return False
+    if request.method in ("GET", "HEAD"):
+        return True
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, "read_only", False)
+
+
+class Replica:
+    def __init__(self, bind_key):
+        self.bind_key = bind_key
+        # unknown until the first check, reads go to the primary meanwhile
+        self.available = False
+        self.lag = None
+        self.checked_at = float("-inf")
+        self.error = None
+        self.reads = 0
+        self.checking = threading.Lock()
+
+
+# picks a replica for the reads of a request, round robin over the replicas that are reachable
+# and not lagging more than REPLICA_MAX_LAG, or None to read from the primary
+class ReplicaRouter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = itertools.count()
+        self.replicas = []
+        self.max_lag = REPLICA_MAX_LAG
+        self.check_interval = REPLICA_LAG_CHECK_INTERVAL
+        self.fallbacks = Counter()
+
+    def init_app(self, app):
+        self.max_lag = app.config.get("REPLICA_MAX_LAG", REPLICA_MAX_LAG)
+        self.check_interval = app.config.get("REPLICA_LAG_CHECK_INTERVAL", REPLICA_LAG_CHECK_INTERVAL)
+        self.replicas = [Replica(bind_key) for bind_key in app.config.get("SQLALCHEMY_BINDS") or {}
+                         if bind_key.startswith(REPLICA_BIND_PREFIX)]
+        self.fallbacks = Counter()
+
+    @property
+    def enabled(self):
+        return bool(self.replicas)
+
+    def choose(self, engines):
+        if not self.replicas:
+            return None
+        start = next(self._next)
+        lagging = False
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            self._check(replica, engines[replica.bind_key])
+            if not replica.available:
+                continue
+            if replica.lag > self.max_lag:
+                lagging = True
+                continue
+            with self._lock:
+                replica.reads += 1
+            return engines[replica.bind_key]
+
+        with self._lock:
+            self.fallbacks["lag" if lagging else "unavailable"] += 1
+        return None
+
+    # refresh the lag when it is older than the check interval, one request checks while the others
+    # keep using the last result
+    def _check(self, replica, engine):
+        if time.monotonic() - replica.checked_at < self.check_interval:
+            return
+        if not replica.checking.acquire(blocking=False):
+            return
+        try:
+            replica.lag = replica_lag(engine)
+            replica.available = True
+            replica.error = None
+        except exc.DBAPIError as err:
+            # logged once when the replica goes down, not on every check
+            if replica.error != str(err.orig):
+                current_app.logger.warning("Replica %s is unavailable: %s", replica.bind_key, err.orig)
+            replica.available = False
+            replica.error = str(err.orig)
+        finally:
+            replica.checked_at = time.monotonic()
+            replica.checking.release()
+
+    def metrics(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_lag_s": self.max_lag,
+                "replicas": {replica.bind_key: {
+                    "available": replica.available,
+                    "lag_s": replica.lag,
+                    "checked_s_ago": round(now - replica.checked_at, 1) if replica.checked_at > 0 else None,
+                    "reads": replica.reads,
+                    "error": replica.error,
+                } for replica in self.replicas},
+                "primary_fallbacks": dict(self.fallbacks),
+            }
+
+
+replica_router = ReplicaRouter()
+
+
+# db.session class: the reads of a read-only request go to one replica chosen for the request,
+# flushes, INSERT / UPDATE / DELETE and SELECT ... FOR UPDATE go to the primary,
+# and once a request wrote, its later reads stay on the primary so it reads its own writes
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and replica_router.enabled:
+            replica = self._replica(clause)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica(self, clause):
+        if self._flushing or self.info.get("primary"):
+            return None
+        if clause is not None and (getattr(clause, "is_dml", False) or
+                                   getattr(clause, "_for_update_arg", None) is not None):
+            self.info["primary"] = True
+            return None
+        if "replica" not in self.info:
+            self.info["replica"] = replica_router.choose(self._db.engines) if is_read_only_request() else None
+        return self.info["replica"]
+
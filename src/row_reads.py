@@ -0,0 +1,46 @@
+from flask import request, current_app
+from init import db
+from query_options import nested_schema, schema_load_options
+
+
+# routes that read flat responses as Core rows, ROW_READS in the app config overrides it
+ROW_READ_ROUTES = ("plant.get_all_plants", "auth.auth_user")
+
+
+# True when the current route is switched to Core rows
+def row_reads_enabled():
+    return request.endpoint in current_app.config.get("ROW_READS", ROW_READ_ROUTES)
+
+
+# the columns a schema dumps, with the primary key for the page cursor,
+# None when the schema dumps a relationship or anything that is not a column
+# kept on the schema instance like the loader options
+def row_columns(model, schema):
+    cached = schema.__dict__.setdefault("_row_columns", {})
+    if model not in cached:
+        cached[model] = _row_columns(model, schema)
+    return cached[model]
+
+
+def _row_columns(model, schema):
+    mapper = db.inspect(model)
+    names = [key.key for key in mapper.primary_key]
+    for name, field in schema.dump_fields.items():
+        attribute = field.attribute or name
+        if nested_schema(field) is not None or attribute not in mapper.column_attrs:
+            return None
+        if attribute not in names:
+            names.append(attribute)
+    return tuple(getattr(model, name) for name in names)
+
+
+# the select of a read route and whether it returns rows:
+# the schema's columns as Core rows when the route reads rows and the schema is flat,
+# rows have the columns as attributes, so the schema dumps them like model instances
+# without building ORM objects or adding them to the session
+# otherwise the model with the loader options of the schema
+def read_statement(model, schema):
+    columns = row_columns(model, schema) if row_reads_enabled() else None
+    if columns is None:
+        return db.select(model).options(*schema_load_options(model, schema)), False
+    return db.select(*columns), True
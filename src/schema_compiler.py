@@ -0,0 +1,110 @@
+import keyword
+from marshmallow import fields
+from marshmallow.decorators import PRE_DUMP, POST_DUMP
+from init import ma
+
+
+# switch back to marshmallow's dump everywhere, e.g. to compare the two
+COMPILED_DUMPS = True
+
+# set by the request profiler to time dumps, called as dump_timer(dump, obj, many)
+dump_timer = None
+
+# schemas being compiled, used to stop on self referencing nesting
+_compiling = set()
+
+
+# class, only and exclude of a schema, to spot a schema nesting itself while it is compiled
+# (marshmallow moves dotted names of only / exclude to the nested fields, so this does not
+# tell two schemas apart, e.g. fields=user.email and fields=user.user_name)
+def _schema_key(schema):
+    only = frozenset(schema.only) if schema.only is not None else None
+    return type(schema), only, frozenset(schema.exclude)
+
+
+# the serializer is built once per schema instance and kept on it, nested schemas are
+# instances of their parent's fields, so each projection has its own serializers
+# and they go away with the schema
+def compile_schema(schema):
+    serialize = schema.__dict__.get("_compiled_serializer")
+    if serialize is None:
+        serialize = schema._compiled_serializer = _compile(_schema_key(schema), schema)
+    return serialize
+
+
+def _compile(key, schema):
+    _compiling.add(key)
+    try:
+        namespace = {"accessor": schema.get_attribute}
+        items = []
+        for index, (name, field) in enumerate(schema.dump_fields.items()):
+            key_name = field.data_key if field.data_key is not None else name
+            expr = _field_expr(schema, name, field, index, namespace)
+            items.append(f"{key_name!r}: {expr}")
+
+        # one function per schema that builds the dict in a single expression,
+        # the field types are resolved here instead of on every dump
+        source = "def serialize(obj):\n    return {" + ", ".join(items) + "}\n"
+        exec(compile(source, f"<compiled {type(schema).__name__}>", "exec"), namespace)
+        return namespace["serialize"]
+    finally:
+        _compiling.discard(key)
+
+
+def _field_expr(schema, name, field, index, namespace):
+    attribute = field.attribute or name
+    value = f"v{index}"
+    # fields the generated code can not reproduce exactly go through marshmallow
+    generic = f"f{index}.serialize({name!r}, obj, accessor=accessor)"
+    namespace[f"f{index}"] = field
+
+    if "." in attribute:
+        return generic
+    if attribute.isidentifier() and not keyword.iskeyword(attribute):
+        getter = f"({value} := obj.{attribute})"
+    else:
+        getter = f"({value} := getattr(obj, {attribute!r}))"
+
+    nested, many = field, False
+    if isinstance(field, fields.List) and isinstance(field.inner, fields.Nested):
+        nested, many = field.inner, True
+    if isinstance(nested, fields.Nested) and isinstance(nested.schema, CompiledSchema):
+        nested_schema = nested.schema
+        if _schema_key(nested_schema) in _compiling or _has_dump_hooks(nested_schema):
+            return generic
+        namespace[f"n{index}"] = compile_schema(nested_schema)
+        if many or nested.many or nested_schema.many:
+            return f"(None if {getter} is None else [n{index}(item) for item in {value}])"
+        return f"(None if {getter} is None else n{index}({value}))"
+
+    field_type = type(field)
+    if field_type is fields.Date and field.format is None and schema.opts.dateformat is None:
+        return f"(None if {getter} is None else {value}.isoformat())"
+    if field_type is fields.String:
+        return f"(None if {getter} is None else str({value}))"
+    if field_type in (fields.Inferred, fields.Raw):
+        # Meta.fields that are not declared, their values are dumped as they are
+        return getter
+    return generic
+
+
+def _has_dump_hooks(schema):
+    return any(schema._hooks.get(tag) for tag in (PRE_DUMP, POST_DUMP))
+
+
+# base class of the schemas, dump uses the compiled serializer of the schema
+# schemas with pre_dump / post_dump hooks keep the marshmallow dump
+class CompiledSchema(ma.Schema):
+    def dump(self, obj, *, many=None):
+        if dump_timer is not None:
+            return dump_timer(self._dump, obj, many)
+        return self._dump(obj, many=many)
+
+    def _dump(self, obj, *, many=None):
+        if not COMPILED_DUMPS or _has_dump_hooks(self):
+            return super().dump(obj, many=many)
+        many = self.many if many is None else bool(many)
+        serialize = compile_schema(self)
+        if many:
+            return [serialize(item) for item in obj]
+        return serialize(obj)
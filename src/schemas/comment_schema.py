@@ -1,9 +1,9 @@
-from init import ma
+from schema_compiler import CompiledSchema
 from marshmallow import fields
 from marshmallow.validate import And, Length, Regexp
 
 
-class CommentSchema(ma.Schema):
+class CommentSchema(CompiledSchema):
     # tell marshmallow which schema to use to convert model format to python object
     # one comment can only have one user and one garden
     user = fields.Nested("UserSchema", only=[
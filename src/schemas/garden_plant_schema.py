@@ -1,8 +1,7 @@
-from init import ma, db
-from marshmallow import fields, validates
-from models.garden_plant import GardenPlant
+from schema_compiler import CompiledSchema
+from marshmallow import fields
 from marshmallow.validate import OneOf
-from marshmallow.exceptions import ValidationError
+from psycopg2 import errorcodes
 
 
 VALID_COLORS = ["Green", "Red", "Yellow",
@@ -12,7 +11,7 @@ VALID_POSITIONS = ["Center", "South", "North", "East",
 VALID_SIZES = ["Small", "Medium", "Large"]
 
 
-class GardenPlantSchema(ma.Schema):
+class GardenPlantSchema(CompiledSchema):
 
     # one garden_plant can only have one garden and one plant
     garden = fields.Nested("GardenSchema", only=[
@@ -31,17 +30,17 @@ class GardenPlantSchema(ma.Schema):
     size = fields.String(validate=OneOf(VALID_SIZES))
 
 
-@validates("position")
-def validate_position(garden_id, body_position):
-    # Check if position is already occupied in this garden
-    # compare database with the parameter
-    count = GardenPlant.query.filter_by(
-        garden_id=garden_id, position=body_position).count()
-    if count > 0:
-        raise ValidationError(
-            f"Position '{body_position}' already been occupied")
+# positions are unique per garden in the database (uq_garden_plants_garden_id_position),
+# check if an IntegrityError from an insert or update came from that constraint
+def is_position_occupied(err):
+    if getattr(err.orig, "pgcode", None) == errorcodes.UNIQUE_VIOLATION:
+        return err.orig.diag.constraint_name == "uq_garden_plants_garden_id_position"
+    # sqlite reports the columns instead of the constraint name
+    return "garden_plants.garden_id, garden_plants.position" in str(err.orig)
 
-    return body_position
+
+def position_occupied_error(position):
+    return {"error": [f"Position '{position}' already been occupied"]}, 400
 
 
 garden_plant_schema = GardenPlantSchema()
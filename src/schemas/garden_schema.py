@@ -1,9 +1,9 @@
-from init import ma
+from schema_compiler import CompiledSchema
 from marshmallow import fields
 from marshmallow.validate import Length, Regexp, And
 
 
-class GardenSchema (ma.Schema):
+class GardenSchema(CompiledSchema):
     user = fields.Nested("UserSchema", only=["user_name", "email"])
     garden_plants = fields.List(fields.Nested(
         "GardenPlantSchema", exclude=["garden"]))
@@ -28,6 +28,19 @@ class GardenSchema (ma.Schema):
     creation_date = fields.Date()
 
 
+# ?view=summary list item, the child counters instead of the garden_plants and comments arrays
+# all fields are columns of gardens, so dumping it loads no other table
+class GardenSummarySchema(CompiledSchema):
+    class Meta:
+        ordered = True
+        fields = ("id", "garden_name", "creation_date", "description",
+                  "plant_count", "comment_count", "last_comment_date")
+
+    creation_date = fields.Date()
+    last_comment_date = fields.Date()
+
+
 garden_schema = GardenSchema()
 gardens_schema = GardenSchema(many=True)
 garden_update_schema = GardenSchema(exclude=["garden_plants", "comments"])
+gardens_summary_schema = GardenSummarySchema(many=True)
@@ -1,4 +1,4 @@
-from init import ma
+from schema_compiler import CompiledSchema
 from marshmallow import fields
 from marshmallow.validate import Length, Regexp, And, OneOf
 
@@ -6,7 +6,7 @@ VALID_WATERING = ["Frequent", "Average", "Minimal"]
 VALID_GROWTH_RATE = ["High", "Moderate", "Low"]
 
 
-class PlantSchema (ma.Schema):
+class PlantSchema(CompiledSchema):
 
     # one to many relationship, one plant can have many garden_plants
     garden_plants = fields.List(fields.Nested(
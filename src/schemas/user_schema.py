@@ -1,9 +1,9 @@
-from init import ma
+from schema_compiler import CompiledSchema
 from marshmallow import fields
 from marshmallow.validate import Length, Email, Regexp, And
 
 
-class UserSchema(ma.Schema):  # User register schema
+class UserSchema(CompiledSchema):  # User register schema
     # tell marshmallow which schema to use to convert model format to python object
     # fields.Nested() is used to nest a schema within a schema
     # one to many relationship, one user can have many gardens and comments
@@ -0,0 +1,301 @@
+import bisect
+import re
+import threading
+import time
+from collections import Counter
+from flask import request, abort, current_app
+from sqlalchemy import event, DDL
+from sqlalchemy.orm import Session
+from init import db
+from models.garden import Garden
+from models.plant import Plant
+from models.comment import Comment
+from pagination import page_args, encode_cursor, decode_cursor
+
+
+# searchable models: the columns of the full text document, and the name columns
+# that are also matched by trigram similarity (prefixes and typos)
+SEARCH_FIELDS = {
+    Garden: (("garden_name", "description"), ("garden_name",)),
+    Plant: (("plant_name", "genus"), ("plant_name", "genus")),
+    Comment: (("message",), ("message",)),
+}
+
+# seconds an in-process index is used before it is rebuilt, so writes of other workers show up
+SEARCH_INDEX_TTL = 60
+# minimum trigram similarity of a misspelled word, the same default as pg_trgm
+SIMILARITY_THRESHOLD = 0.3
+
+# ordering of the results, the rank is computed per query, the id breaks ties
+RANK = db.literal_column("rank", db.Float)
+# text search configuration without stemming or stop words, names and genera are not english
+SIMPLE = db.text("'simple'::regconfig")
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def _terms(text):
+    return WORD.findall(text.lower()) if text else []
+
+
+# ?q= of a search route, the words to look for
+def search_terms():
+    terms = _terms(request.args.get("q"))
+    if not terms:
+        abort(400, description="'q' must contain at least one letter or number")
+    return terms
+
+
+# postgres: the full text document of a model, the GIN index is built on the same expression
+def search_document(model):
+    columns, _ = SEARCH_FIELDS[model]
+    # constants are inlined, so the query renders the same expression as the index
+    text = db.func.coalesce(model.__table__.c[columns[0]], db.text("''"))
+    for name in columns[1:]:
+        text = text.concat(db.text("' '")).concat(
+            db.func.coalesce(model.__table__.c[name], db.text("''")))
+    return db.func.to_tsvector(SIMPLE, text)
+
+
+# pg_trgm provides the trigram operator classes, created with the tables
+TRIGRAM_EXTENSION = DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+event.listen(db.metadata, "before_create", TRIGRAM_EXTENSION)
+
+# GIN indexes on the full text document and on the trigrams of the name columns, postgres only
+for _model, (_, _trigram_columns) in SEARCH_FIELDS.items():
+    _table = _model.__table__
+    db.Index(f"ix_{_table.name}_search", search_document(_model),
+             postgresql_using="gin").ddl_if(dialect="postgresql")
+    for _name in _trigram_columns:
+        db.Index(f"ix_{_table.name}_{_name}_trgm", _table.c[_name], postgresql_using="gin",
+                 postgresql_ops={_name: "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+
+
+# search a model and return one page of matching rows, best matches first, and the next page cursor
+# the query is matched by prefix on every word (all words must match) or by trigram similarity of the name columns
+# criteria narrow the search, e.g. the comments of one garden
+def search(model, terms, *criteria, options=()):
+    limit, after = page_args()
+    keys = (RANK, model.id)
+    after = decode_cursor(after, keys) if after else None
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        hits = _search_postgres(model, terms, criteria, options, after, limit + 1)
+    else:
+        hits = _search_index(model, terms, criteria, options, after, limit + 1)
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_cursor(_Hit(*hits[-1]), keys)
+    return [row for _, row in hits], next_cursor
+
+
+class _Hit:
+    def __init__(self, rank, row):
+        self.rank = rank
+        self.id = row.id
+
+
+def _search_postgres(model, terms, criteria, options, after, count):
+    _, trigram_columns = SEARCH_FIELDS[model]
+    phrase = " ".join(terms)
+    # the terms are plain words, so they are safe in to_tsquery syntax
+    query = db.func.to_tsquery(SIMPLE, " & ".join(f"{term}:*" for term in terms))
+    document = search_document(model)
+    columns = [model.__table__.c[name] for name in trigram_columns]
+
+    similarity = [db.func.word_similarity(phrase, column) for column in columns]
+    # double precision, so the rank in the cursor compares equal to the row it came from
+    rank = db.cast(db.func.ts_rank(document, query) +
+                   (db.func.greatest(*similarity) if len(similarity) > 1 else similarity[0]), db.Float)
+    match = db.or_(document.op("@@")(query),
+                   *[db.literal(phrase).op("<%")(column) for column in columns])
+
+    stmt = db.select(model, rank.label("rank")).where(match, *criteria).options(*options)
+    if after:
+        stmt = stmt.where(db.tuple_(rank, model.id) < db.tuple_(*after))
+    stmt = stmt.order_by(rank.desc(), model.id.desc()).limit(count)
+    return [(row.rank, row[0]) for row in db.session.execute(stmt)]
+
+
+def _search_index(model, terms, criteria, options, after, count):
+    ranked = search_indexes[model].search(terms)
+    if after:
+        after = tuple(after)
+        ranked = [hit for hit in ranked if hit < after]
+
+    # load the rows of the best ids, ids of deleted rows and rows outside the criteria are skipped
+    hits = []
+    position = 0
+    while len(hits) < count and position < len(ranked):
+        chunk = ranked[position:position + count * 2]
+        position += len(chunk)
+        stmt = db.select(model).where(model.id.in_([row_id for _, row_id in chunk]), *criteria)
+        rows = {row.id: row for row in db.session.scalars(stmt.options(*options))}
+        hits.extend((rank, rows[row_id]) for rank, row_id in chunk if row_id in rows)
+    return hits[:count]
+
+
+def _trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# in-process inverted index of one model, the search backend when the database is not postgres
+# word -> {row id: occurrences}, built from the database on the first search,
+# kept up to date by ORM writes in this process and rebuilt after bulk writes or SEARCH_INDEX_TTL
+class InvertedIndex:
+    def __init__(self, model):
+        self.model = model
+        self.columns, _ = SEARCH_FIELDS[model]
+        self._lock = threading.Lock()
+        self.postings = None
+        self.documents = {}
+        # sorted words for prefix lookups, sorted again on the next search after a change
+        self.words = None
+        self.built_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self.postings = None
+
+    def _build(self):
+        self.postings = {}
+        self.documents = {}
+        stmt = db.select(self.model.id, *[getattr(self.model, name) for name in self.columns])
+        for row in db.session.execute(stmt.execution_options(yield_per=1000)):
+            self._add(row[0], row[1:])
+        self.words = None
+        self.built_at = time.monotonic()
+
+    def _add(self, row_id, values):
+        counts = Counter(word for value in values for word in _terms(value))
+        self.documents[row_id] = set(counts)
+        for word, occurrences in counts.items():
+            self.postings.setdefault(word, {})[row_id] = occurrences
+
+    def _remove(self, row_id):
+        for word in self.documents.pop(row_id, ()):
+            postings = self.postings.get(word)
+            if postings is not None:
+                postings.pop(row_id, None)
+                if not postings:
+                    del self.postings[word]
+
+    # apply committed ORM changes, rows is a list of (id, column values or None when deleted)
+    def update(self, rows):
+        with self._lock:
+            if self.postings is None:
+                return
+            for row_id, values in rows:
+                self._remove(row_id)
+                if values is not None:
+                    self._add(row_id, values)
+            self.words = None
+
+    # words of the index matching a search term, with how good the match is:
+    # 1 for the same word, 0.8 for a word starting with the term, the similarity for a misspelling
+    def _matches(self, term):
+        matches = []
+        start = bisect.bisect_left(self.words, term)
+        for word in self.words[start:]:
+            if not word.startswith(term):
+                break
+            matches.append((word, 1.0 if word == term else 0.8))
+        if matches:
+            return matches
+
+        trigrams = _trigrams(term)
+        for word in self.words:
+            other = _trigrams(word)
+            similarity = len(trigrams & other) / len(trigrams | other)
+            if similarity >= SIMILARITY_THRESHOLD:
+                matches.append((word, similarity * 0.6))
+        return matches
+
+    # (rank, id) of the rows matching every term, best first
+    def search(self, terms):
+        ttl = current_app.config.get("SEARCH_INDEX_TTL", SEARCH_INDEX_TTL)
+        with self._lock:
+            if self.postings is None or time.monotonic() - self.built_at > ttl:
+                self._build()
+            if self.words is None:
+                self.words = sorted(self.postings)
+
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for word, quality in self._matches(term):
+                    for row_id, occurrences in self.postings[word].items():
+                        score = quality * occurrences / (occurrences + 1)
+                        term_scores[row_id] = max(term_scores.get(row_id, 0.0), score)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {row_id: score + term_scores[row_id]
+                              for row_id, score in scores.items() if row_id in term_scores}
+                if not scores:
+                    return []
+
+        return sorted(((round(score, 6), row_id) for row_id, score in scores.items()), reverse=True)
+
+
+# one index per searchable model
+search_indexes = {model: InvertedIndex(model) for model in SEARCH_FIELDS}
+
+
+# keep the in-process indexes in step with ORM writes, applied once the transaction is committed
+@event.listens_for(Session, "after_flush")
+def _collect_search_changes(session, flush_context):
+    changes = session.info.setdefault("search_changes", [])
+    for instance in session.new | session.dirty:
+        if type(instance) in SEARCH_FIELDS:
+            columns, _ = SEARCH_FIELDS[type(instance)]
+            changes.append((type(instance), instance.id, [getattr(instance, name) for name in columns]))
+    for instance in session.deleted:
+        if type(instance) in SEARCH_FIELDS:
+            changes.append((type(instance), instance.id, None))
+
+
+# bulk INSERT / UPDATE / DELETE statements do not say which rows they change, the index is rebuilt instead
+# UPDATEs that do not set a searched column (e.g. the version and counters of bump_garden_versions) are skipped
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is None or mapper.class_ not in SEARCH_FIELDS:
+            return
+        columns, _ = SEARCH_FIELDS[mapper.class_]
+        if orm_execute_state.is_update and not _updated_columns(orm_execute_state) & set(columns):
+            return
+        orm_execute_state.session.info.setdefault("search_rebuild", set()).add(mapper.class_)
+
+
+# names of the columns an UPDATE sets, with .values() / .ordered_values() and with the
+# parameter rows of an UPDATE by primary key, e.g. session.execute(update(Garden), [{...}])
+def _updated_columns(orm_execute_state):
+    statement = orm_execute_state.statement
+    keys = [*(statement._values or ()), *(key for key, _ in statement._ordered_values or ())]
+    names = {getattr(key, "key", key) for key in keys}
+    parameters = orm_execute_state.parameters or {}
+    for row in parameters if isinstance(parameters, list) else [parameters]:
+        names.update(row)
+    return names
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_search_changes(session):
+    changes = session.info.pop("search_changes", [])
+    for model in session.info.pop("search_rebuild", set()):
+        search_indexes[model].invalidate()
+    by_model = {}
+    for model, row_id, values in changes:
+        by_model.setdefault(model, []).append((row_id, values))
+    for model, rows in by_model.items():
+        search_indexes[model].update(rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_search_changes(session):
+    session.info.pop("search_changes", None)
+    session.info.pop("search_rebuild", None)
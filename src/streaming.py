@@ -0,0 +1,58 @@
+from flask import Response, request, current_app, stream_with_context
+from init import db
+
+
+STREAM_BATCH_SIZE = 500
+
+
+# ?stream=true switches a list route from paginated pages to a streamed dump of the whole collection
+def stream_requested():
+    return request.args.get("stream", "").lower() in ("1", "true", "yes")
+
+
+# stream a query result as a JSON array
+# rows are fetched in batches with yield_per (a server-side cursor on postgres),
+# each batch is dumped with the route's schema and written out as a chunk of the array,
+# then dropped from the session, so memory stays flat no matter how many rows there are
+# rows=True for a select of columns, the Core rows are dumped and nothing is added to the session
+def stream_dump(stmt, schema, rows=False):
+    batch_size = current_app.config.get("STREAM_BATCH_SIZE", STREAM_BATCH_SIZE)
+
+    def generate():
+        execute = db.session.execute if rows else db.session.scalars
+        result = execute(stmt.execution_options(yield_per=batch_size))
+        separator = ""
+        yield "["
+        for batch in result.partitions():
+            items = schema.dump(batch, many=True)
+            yield separator + ",".join(current_app.json.dumps(item, separators=(",", ":")) for item in items)
+            separator = ","
+            if not rows:
+                for row in batch:
+                    if row in db.session:
+                        db.session.expunge(row)
+        yield "]"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+# stream_dump for an AsyncSession, the body is an async generator sent by the ASGI app
+def stream_dump_async(session, stmt, schema):
+    batch_size = current_app.config.get("STREAM_BATCH_SIZE", STREAM_BATCH_SIZE)
+    json = current_app.json
+
+    async def generate():
+        result = await session.stream_scalars(
+            stmt.execution_options(yield_per=batch_size))
+        separator = ""
+        yield "["
+        async for batch in result.partitions():
+            items = schema.dump(batch, many=True)
+            yield separator + ",".join(json.dumps(item, separators=(",", ":")) for item in items)
+            separator = ","
+            for row in batch:
+                if row in session:
+                    session.expunge(row)
+        yield "]"
+
+    return Response(generate(), mimetype="application/json")
@@ -0,0 +1,68 @@
+import sqlite3
+import pytest
+from sqlalchemy import inspect, exc
+from main import create_app
+from init import db
+from db_upgrade import upgrade_db, UpgradeError
+
+
+# tables as the first version of `flask db create` made them, without counters and ON DELETE CASCADE
+LEGACY_SCHEMA = """
+CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, user_name VARCHAR(100) NOT NULL UNIQUE,
+    email VARCHAR(200) NOT NULL UNIQUE, password VARCHAR NOT NULL, is_admin BOOLEAN);
+CREATE TABLE plants (id INTEGER NOT NULL PRIMARY KEY, plant_name VARCHAR(100) NOT NULL UNIQUE,
+    genus VARCHAR(100) NOT NULL, watering VARCHAR, growth_rate VARCHAR);
+CREATE TABLE gardens (id INTEGER NOT NULL PRIMARY KEY, garden_name VARCHAR(200) NOT NULL UNIQUE,
+    creation_date DATE, description TEXT, user_id INTEGER NOT NULL REFERENCES users (id));
+CREATE TABLE comments (id INTEGER NOT NULL PRIMARY KEY, message TEXT NOT NULL, comment_date DATE,
+    user_id INTEGER NOT NULL REFERENCES users (id), garden_id INTEGER NOT NULL REFERENCES gardens (id));
+CREATE TABLE garden_plants (id INTEGER NOT NULL PRIMARY KEY, color VARCHAR, position VARCHAR NOT NULL,
+    size VARCHAR, garden_id INTEGER NOT NULL REFERENCES gardens (id), plant_id INTEGER NOT NULL REFERENCES plants (id));
+INSERT INTO users VALUES (1, 'User1', 'user1@email.com', 'x', 0);
+INSERT INTO plants VALUES (1, 'Fraser Fir', 'Abies Fraseri', 'Frequent', 'Moderate');
+INSERT INTO gardens VALUES (1, 'Garden1', '2023-07-01', 'first', 1);
+INSERT INTO comments VALUES (1, 'nice', '2023-07-02', 1, 1), (2, 'great', '2023-07-03', 1, 1);
+INSERT INTO garden_plants VALUES (1, 'Green', 'North', 'Small', 1, 1);
+"""
+
+
+def legacy_app(monkeypatch, tmp_path, *statements):
+    path = tmp_path / "legacy.db"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(LEGACY_SCHEMA + ";".join(statements))
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{path}")
+    monkeypatch.setenv("JWT_SECRET_KEY", "test")
+    return create_app()
+
+
+def test_upgrade_adds_columns_and_cascades_to_a_legacy_database(monkeypatch, tmp_path):
+    app = legacy_app(monkeypatch, tmp_path)
+
+    with app.app_context():
+        upgraded = upgrade_db()
+        assert "foreign key (garden_id) -> gardens ON DELETE CASCADE" in upgraded["comments"]
+        assert upgrade_db() == {}
+
+        garden = db.session.execute(db.text(
+            "SELECT plant_count, comment_count, last_comment_date FROM gardens")).one()
+        assert tuple(garden) == (1, 2, "2023-07-03")
+        assert {fk["options"].get("ondelete") for fk in inspect(db.engine).get_foreign_keys("comments")} == {"CASCADE"}
+
+        with pytest.raises(exc.IntegrityError):
+            db.session.execute(db.text("INSERT INTO garden_plants (position, garden_id, plant_id) VALUES ('North', 1, 1)"))
+        db.session.rollback()
+
+        db.session.execute(db.text("DELETE FROM users"))
+        db.session.commit()
+        for table in ("gardens", "comments", "garden_plants"):
+            assert db.session.execute(db.text(f"SELECT count(*) FROM {table}")).scalar() == 0
+
+
+# two plants on one position, from before positions were unique, stop the upgrade before it changes anything
+def test_upgrade_stops_on_duplicate_positions(monkeypatch, tmp_path):
+    app = legacy_app(monkeypatch, tmp_path, "INSERT INTO garden_plants VALUES (2, 'Red', 'North', 'Large', 1, 1)")
+
+    with app.app_context():
+        with pytest.raises(UpgradeError, match=r"garden_plants has duplicate \(garden_id, position\)"):
+            upgrade_db()
+        assert "version" not in {column["name"] for column in inspect(db.engine).get_columns("gardens")}
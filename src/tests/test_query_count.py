@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy import event
+from main import create_app
+from init import db
+from controllers.cli_controller import generate_seed_data
+
+
+# app on an in-memory sqlite database seeded with the given number of gardens (one per user),
+# each with 3 plants and comments, and a counter of the statements it runs
+def seeded_app(monkeypatch, gardens, comments_per_garden):
+    monkeypatch.setenv("DATABASE_URL", "sqlite://")
+    monkeypatch.setenv("JWT_SECRET_KEY", "test")
+    monkeypatch.setenv("BCRYPT_LOG_ROUNDS", "4")
+    app = create_app()
+    statements = []
+    with app.app_context():
+        db.create_all(bind_key=None)
+        generate_seed_data(gardens, 1, 20, 3, comments_per_garden, 5000, False, 0)
+        db.session.remove()
+        event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return app, statements
+
+
+def query_count(app, statements, url):
+    statements.clear()
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize("url", ["/garden/?limit=200", "/garden/1"])
+def test_garden_reads_run_a_fixed_number_of_queries(monkeypatch, url):
+    # ten times the gardens, and ten times the comments on each garden (commented by more users)
+    small = query_count(*seeded_app(monkeypatch, 5, 2), url)
+    large = query_count(*seeded_app(monkeypatch, 50, 20), url)
+    assert small == large
@@ -0,0 +1,15 @@
+import schema_compiler
+from models.plant import Plant
+from schemas.plant_schema import PlantSchema
+
+
+# COMPILED_DUMPS=False falls back to marshmallow's dump, also on a schema that already has a compiled serializer
+def test_dump_falls_back_after_a_compiled_dump(monkeypatch):
+    schema = PlantSchema(only=("id", "plant_name", "genus"))
+    plant = Plant(id=1, plant_name="Fraser Fir", genus="Abies Fraseri")
+
+    compiled = schema.dump(plant)
+    monkeypatch.setattr(schema_compiler, "COMPILED_DUMPS", False)
+
+    assert schema.dump(plant) == compiled == {"id": 1, "plant_name": "Fraser Fir", "genus": "Abies Fraseri"}
+    assert schema.dump([plant], many=True) == [compiled]
@@ -0,0 +1,51 @@
+import threading
+import time
+from flask import current_app
+from init import db
+from models.user import User
+
+
+TOKEN_VERSION_CACHE_TTL = 30
+
+# user id -> (token version, expiry time), shared by the requests of this worker
+_versions = {}
+_lock = threading.Lock()
+
+
+# current token version of a user, read from the database at most once per TTL
+# None means the user no longer exists
+def current_token_version(user_id):
+    now = time.monotonic()
+    with _lock:
+        cached = _versions.get(user_id)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    stmt = db.select(User.token_version).filter_by(id=user_id)
+    # read from the primary, a lagging replica would still accept revoked tokens
+    version = db.session.scalar(stmt, bind_arguments={"bind": db.engine})
+    ttl = current_app.config.get("TOKEN_VERSION_CACHE_TTL", TOKEN_VERSION_CACHE_TTL)
+    with _lock:
+        _versions[user_id] = (version, now + ttl)
+    return version
+
+
+# a token is revoked once the user's token version moved past the one it was signed with
+def is_token_revoked(jwt_payload):
+    try:
+        user_id = int(jwt_payload["sub"])
+    except (KeyError, ValueError):
+        return True
+    return current_token_version(user_id) != jwt_payload.get("token_version", 0)
+
+
+# revoke every token issued to the user, e.g. after the admin status changed
+# this worker sees the change right away, other workers within TOKEN_VERSION_CACHE_TTL seconds
+def bump_token_version(user):
+    user.token_version = (user.token_version or 0) + 1
+
+
+# drop the cached version after a commit, so the next check reads the new one
+def forget_token_version(user_id):
+    with _lock:
+        _versions.pop(user_id, None)